@@ -0,0 +1,132 @@
+"""Benchmarks the throughput of mixed course rating / recommendation traffic issued concurrently by several processes
+against a SQLite database, using a plain engine and the one created by :func:'database.create_database_engine'.
+
+Usage: python benchmark_concurrency.py [--processes 4] [--seconds 10] [--students 200] [--courses 20]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, IntegrityError
+
+from address import Address
+from database import create_database_engine, create_session_factory
+from student import Student
+from union import StudentUnion  # noqa: F401 (registers the class referenced by Student.unions)
+from university import University, UniversityType
+from utils import Base
+
+DATABASE_URL = 'sqlite:///data/benchmark.db'
+RATING_SHARE = 0.7  # The share of the operations which rate a course, the rest generate recommendations
+
+
+def create_database(directory, number_students, number_courses):
+    """Creates a database of a single university with enrolled students and a trained model in ''directory''."""
+    os.chdir(directory)
+    os.makedirs('data')
+    engine = create_engine(DATABASE_URL)
+    Base.metadata.create_all(engine)
+    session = create_session_factory(engine)()
+
+    address = Address(country='United Kingdom', city='London', address_line='Houghton Street', postal_code='WC2A 2AE')
+    university = University(name='Benchmark University', category=UniversityType.PUBLIC, abbreviation='BU',
+                            address=address, username='benchmark', password='pw')
+    courses = [university.add_course(name=f'Course {i}', course_number=f'C{i}', semester_of_availability=i % 8 + 1)
+               for i in range(number_courses)]
+    session.add_all([address, university] + courses)
+
+    random_state = random.Random(0)
+    for i in range(number_students):
+        student = university.register_student(name=f'Student {i}', student_number=f'S{i}', terms_completed=i % 8,
+                                              username=f'student{i}', password='pw')
+        session.add(student)
+        for course in random_state.sample(courses, 5):
+            enrollment = course.add_student(student=student, start_date=date(2020, 2, 13))
+            enrollment.course_rating = random_state.randint(1, 10)
+    session.commit()
+
+    university.recommendation_system.reload_ratings()
+    university.recommendation_system.train_model(epochs=5)
+    session.commit()
+    engine.dispose()
+
+
+def run_worker(directory, tuned, seconds, seed):
+    """Issues a mix of course ratings and recommendation requests for ''seconds'', each committed separately.
+
+    :return: A tuple (number of completed operations, number of operations which failed on a lock, number of
+    operations which failed on a constraint violated by a concurrent operation).
+    """
+    os.chdir(directory)
+    engine = create_database_engine(DATABASE_URL) if tuned else create_engine(DATABASE_URL)
+    session = create_session_factory(engine)()
+    random_state = random.Random(seed)
+    students = session.query(Student).all()
+
+    completed, failed, conflicts = 0, 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        student = random_state.choice(students)
+        try:
+            if random_state.random() < RATING_SHARE:
+                enrollment = random_state.choice(student.enrollments)
+                student.rate_course(enrollment, random_state.randint(1, 10), session, reload_ratings=False)
+            else:
+                student.generate_recommendations(session)
+            completed += 1
+        except OperationalError:
+            session.rollback()
+            failed += 1
+        except IntegrityError:
+            session.rollback()
+            conflicts += 1
+    engine.dispose()
+    return completed, failed, conflicts
+
+
+def run(template_directory, tuned, processes, seconds):
+    """Runs the workers against a fresh copy of the database, and returns the total throughput and the numbers of
+    operations which failed on a lock and on a conflict.
+    """
+    directory = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        shutil.copytree(os.path.join(template_directory, 'data'), os.path.join(directory, 'data'), symlinks=True)
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_worker, [(directory, tuned, seconds, seed) for seed in range(processes)])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    completed = sum(result[0] for result in results)
+    failed = sum(result[1] for result in results)
+    conflicts = sum(result[2] for result in results)
+    return completed / seconds, failed, conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--courses', type=int, default=20)
+    arguments = parser.parse_args()
+
+    working_directory = os.getcwd()
+    template_directory = tempfile.mkdtemp(prefix='benchmark_template_')
+    try:
+        create_database(template_directory, arguments.students, arguments.courses)
+        for name, tuned in (('default engine', False), ('tuned engine', True)):
+            throughput, failed, conflicts = run(template_directory, tuned, arguments.processes, arguments.seconds)
+            print(f'{name:>15}: {throughput:8.1f} operations/s, {failed} operations failed on a lock, '
+                  f'{conflicts} on a conflict')
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(template_directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
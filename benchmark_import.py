@@ -0,0 +1,65 @@
+"""Benchmarks the time needed to import the ORM modules, and checks that importing them does not load the numerical
+libraries, which are only needed once a recommender operation runs. Exits with a non-zero status on a regression.
+
+Usage: python benchmark_import.py [--repeat 5] [--max-seconds 1.0] [--modules university student tutor]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+FORBIDDEN_PACKAGES = ('numpy', 'pandas')
+
+
+def measure_import(module):
+    """Imports ''module'' in a fresh interpreter with ''-X importtime''.
+
+    :return: A tuple (cumulative import time of the module in seconds, set of the names of all imported modules).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, check=True)
+    imported, seconds = set(), None
+    for line in result.stderr.splitlines():
+        # Lines look like 'import time:  self [us] | cumulative | imported package'
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            seconds = int(cumulative) / 1e6
+    return seconds, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=1.0,
+                        help='The maximum median import time of each module')
+    parser.add_argument('--modules', nargs='+', default=['university', 'student', 'tutor'])
+    arguments = parser.parse_args()
+
+    failed = False
+    for module in arguments.modules:
+        timings, imported = [], set()
+        for _ in range(arguments.repeat):
+            seconds, imported = measure_import(module)
+            timings.append(seconds)
+        median = statistics.median(timings)
+        loaded = sorted(package for package in FORBIDDEN_PACKAGES
+                        if any(name == package or name.startswith(f'{package}.') for name in imported))
+
+        problems = []
+        if loaded:
+            problems.append(f'loads {", ".join(loaded)}')
+        if median > arguments.max_seconds:
+            problems.append(f'slower than {arguments.max_seconds:.3f}s')
+        print(f'{module:>15}: {median * 1000:8.1f} ms (median of {arguments.repeat}), {len(imported)} modules'
+              f'{"  FAILED: " + "; ".join(problems) if problems else ""}')
+        failed = failed or bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
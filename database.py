@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import sessionmaker
+
+
+def create_database_engine(url='sqlite:///data/test.db', *, busy_timeout=30, synchronous='NORMAL', pool_size=10,
+                           max_overflow=20, pool_recycle=1800, executemany_page_size=1000, **engine_options):
+    """Creates a database engine with defaults tuned for concurrent use.
+
+    For SQLite, every connection switches the database to write-ahead logging (so that readers do not block the
+    writer and vice versa), waits up to ''busy_timeout'' seconds for a lock instead of failing immediately, and uses
+    the given ''synchronous'' setting (NORMAL is durable in WAL mode, apart from the last transactions on power
+    loss). For server databases, a pool of ''pool_size'' connections is kept, checked with a ping before use and
+    recycled after ''pool_recycle'' seconds. For PostgreSQL with psycopg2, the rows of bulk inserts are sent in pages
+    of ''executemany_page_size'' instead of one statement per row.
+
+    :param url: The database URL.
+    :param busy_timeout: SQLite only - the number of seconds to wait for a lock held by another connection.
+    :param synchronous: SQLite only - the value of the ''synchronous'' pragma (OFF, NORMAL, FULL or EXTRA).
+    :param pool_size: Server databases only - the number of connections kept in the pool.
+    :param max_overflow: Server databases only - the number of connections opened beyond ''pool_size'' under load.
+    :param pool_recycle: Server databases only - the number of seconds after which a connection is reopened.
+    :param executemany_page_size: PostgreSQL (psycopg2) only - the number of rows sent in a single statement.
+    :param engine_options: Other keyword arguments passed to :func:'sqlalchemy.create_engine' (overriding the
+    defaults above).
+    :return: SQLAlchemy :class:'Engine' object.
+    """
+    url = make_url(url)
+    backend, driver = url.get_backend_name(), url.get_driver_name()
+
+    if backend == 'sqlite':
+        options = dict(connect_args={'timeout': busy_timeout})
+        options.update(engine_options)
+        engine = create_engine(url, **options)
+        in_memory = url.database in (None, '', ':memory:')
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not in_memory:
+                cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout * 1000)}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+            cursor.close()
+
+        return engine
+
+    options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True, pool_recycle=pool_recycle)
+    if backend == 'postgresql' and driver == 'psycopg2':
+        options.update(executemany_mode='values', executemany_values_page_size=executemany_page_size,
+                       executemany_batch_page_size=executemany_page_size)
+    options.update(engine_options)
+    return create_engine(url, **options)
+
+
+def create_session_factory(engine=None, **session_options):
+    """Creates a :class:'sessionmaker' bound to the ''engine''.
+
+    :param engine: SQLAlchemy :class:'Engine' object. If ''None'', an engine is created with
+    :func:'create_database_engine' using the default URL.
+    :param session_options: Keyword arguments passed to :class:'sessionmaker'.
+    :return: SQLAlchemy :class:'sessionmaker' object.
+    """
+    if engine is None:
+        engine = create_database_engine()
+    return sessionmaker(bind=engine, **session_options)
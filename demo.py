@@ -1,5 +1,4 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, with_polymorphic
+from sqlalchemy.orm import with_polymorphic
 from datetime import date
 import os
 
@@ -11,6 +10,7 @@ from recommender import Ratings
 from student import Student, StudentCourse
 from tutor import Tutor, DegreeCategory
 from university import UniversityType, University
+from database import create_database_engine, create_session_factory
 from utils import Base
 
 # Create a data directory
@@ -18,13 +18,13 @@ if not os.path.exists('./data'):
     os.makedirs('./data')
 
 # Define the databse engine
-engine = create_engine('sqlite:///data/test.db')
+engine = create_database_engine('sqlite:///data/test.db')
 
 # Generate all database tables
 Base.metadata.create_all(engine)
 
 # Start a new session
-Session = sessionmaker(bind=engine)
+Session = create_session_factory(engine)
 session = Session()
 
 # Create an address
@@ -0,0 +1,275 @@
+import itertools
+import multiprocessing
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from recommender import index_ratings, factorize
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def split_ratings(known_ratings_matrix, test_fraction=0.2, minimum_ratings=2, random_state=None):
+    """Splits the known ratings into a training set and a held-out set, separately for each student. Every student with
+    at least ''minimum_ratings'' ratings has a ''test_fraction'' of them (but at least one, and never all of them) held
+    out, the remaining students are kept entirely in the training set.
+
+    :param known_ratings_matrix: :class:'DataFrame' of known ratings, as returned by
+    :class:'RecommendationSystem'.''known_ratings_matrix''.
+    :param test_fraction: Fraction of each student's ratings to hold out.
+    :param minimum_ratings: Minimum number of ratings a student needs to have any of them held out.
+    :param random_state: Seed or :class:'numpy.random.Generator' used to choose the held-out ratings.
+    :return: A tuple of :class:'DataFrame' objects (training ratings, held-out ratings).
+    """
+    random_state = np.random.default_rng(random_state)
+    students = known_ratings_matrix.iloc[:, 0]
+
+    # Rank the ratings of each student in a random order, and hold out the lowest ranked ones
+    rank = pd.Series(random_state.random(len(students)), index=known_ratings_matrix.index)\
+        .groupby(students).rank(method='first')
+    counts = students.groupby(students).transform('size')
+    number_held_out = np.where(counts >= minimum_ratings,
+                               np.clip(np.floor(counts * test_fraction), 1, counts - 1), 0)
+    held_out = (rank <= number_held_out).to_numpy()
+
+    return known_ratings_matrix[~held_out], known_ratings_matrix[held_out]
+
+
+def rmse(Q, P, student_indices, course_indices, ratings):
+    """Computes the root mean squared error of the ratings predicted by the factors Q and P.
+
+    :param Q: Course factor matrix (|courses| x factors).
+    :param P: Student factor matrix (|students| x factors).
+    :param student_indices: Array of row positions in P of the rated students.
+    :param course_indices: Array of row positions in Q of the rated courses.
+    :param ratings: Array of the known ratings.
+    :return: The RMSE, or NaN if there are no ratings.
+    """
+    if len(ratings) == 0:
+        return np.nan
+    residuals = ratings - np.einsum('ij,ij->i', Q[course_indices], P[student_indices])
+    return float(np.sqrt(np.mean(residuals ** 2)))
+
+
+def precision_recall_at_k(Q, P, train, test, k=3, relevance_threshold=7, block_size=1024):
+    """Computes the mean precision and recall of the top ''k'' recommendations, over the students with at least one
+    relevant held-out rating. The courses rated in the training set are never recommended, and a held-out course is
+    relevant if its rating is at least ''relevance_threshold''. The scores are computed for blocks of ''block_size''
+    students at a time, to bound the memory used.
+
+    :param Q: Course factor matrix (|courses| x factors).
+    :param P: Student factor matrix (|students| x factors).
+    :param train: A tuple of arrays (student indices, course indices, ratings) of the training ratings.
+    :param test: A tuple of arrays (student indices, course indices, ratings) of the held-out ratings.
+    :param k: The number of recommendations.
+    :param relevance_threshold: The minimum rating of a relevant course.
+    :param block_size: The number of students scored at a time.
+    :return: A tuple (precision, recall), NaNs if no student has a relevant held-out rating.
+    """
+    train_students, train_courses, _ = train
+    test_students, test_courses, test_ratings = test
+    relevant = test_ratings >= relevance_threshold
+    relevant_students, relevant_courses = test_students[relevant], test_courses[relevant]
+
+    evaluated_students = np.unique(relevant_students)
+    if len(evaluated_students) == 0:
+        return np.nan, np.nan
+    k = min(k, Q.shape[0])
+
+    hits, number_relevant = [], []
+    for start in range(0, len(evaluated_students), block_size):
+        block = evaluated_students[start:start + block_size]
+        # Position of each student within the block, -1 for students outside of it
+        position = np.full(P.shape[0], -1)
+        position[block] = np.arange(len(block))
+
+        scores = P[block] @ Q.T
+        in_block = position[train_students] >= 0
+        scores[position[train_students[in_block]], train_courses[in_block]] = -np.inf
+
+        is_relevant = np.zeros(scores.shape, dtype=bool)
+        in_block = position[relevant_students] >= 0
+        is_relevant[position[relevant_students[in_block]], relevant_courses[in_block]] = True
+
+        top_k = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        hits.append(np.take_along_axis(is_relevant, top_k, axis=1).sum(axis=1))
+        number_relevant.append(is_relevant.sum(axis=1))
+
+    hits, number_relevant = np.concatenate(hits), np.concatenate(number_relevant)
+    return float(np.mean(hits / k)), float(np.mean(hits / number_relevant))
+
+
+class Trial:
+    """Represents the outcome of training and evaluating the model with one setting of the hyperparameters.
+
+    :param hyperparameters: Dictionary of the keyword arguments passed to :func:'factorize'.
+    """
+
+    def __init__(self, hyperparameters):
+        self.hyperparameters = hyperparameters
+        self.rmse = None
+        self.precision = None
+        self.recall = None
+        self.training_errors = []
+        self.validation_errors = []
+        self.stopped_early = False
+        self.wall_time = None
+        self.peak_memory = None  # Only measured with ''trace_memory''
+        self.max_rss = None
+
+    @property
+    def epochs_run(self):
+        return len(self.training_errors)
+
+    def __str__(self):
+        parameters = ', '.join(f'{name}={value}' for name, value in self.hyperparameters.items())
+        return f'Trial({parameters}): RMSE={self.rmse:.4f}, precision@k={self.precision:.3f}, ' \
+               f'recall@k={self.recall:.3f}, ' \
+               f'epochs={self.epochs_run}{" (stopped early)" if self.stopped_early else ""}, ' \
+               f'time={self.wall_time:.2f}s' + \
+            (f', peak memory={self.peak_memory / 2 ** 20:.1f}MiB' if self.peak_memory is not None else '')
+
+
+def run_trial(hyperparameters, *, number_students, number_courses, train, test, k=3, relevance_threshold=7,
+              evaluation_interval=1, patience=3, minimum_improvement=1e-4, prune_ratio=None, best_rmse=None,
+              best_rmse_lock=None, trace_memory=False, random_state=None):
+    """Trains the model on the ''train'' ratings and evaluates it on the ''test'' ratings. The held-out RMSE is
+    computed every ''evaluation_interval'' epochs, and training stops early if it has not improved for ''patience''
+    evaluations, or if it is worse than ''prune_ratio'' times the best RMSE of the trials completed so far.
+
+    The ''wall_time'' of the trial is measured without tracing memory allocations, which slows the SGD loop down
+    several times. With ''trace_memory'', the trial is then repeated with the same random state while
+    :mod:'tracemalloc' records the ''peak_memory'' allocated by Python. The ''max_rss'' is the peak resident set size of
+    the process, which only describes the trial if the process runs a single trial (as in
+    :func:'hyperparameter_search').
+
+    :param hyperparameters: Dictionary of the keyword arguments passed to :func:'factorize'.
+    :param number_students: Number of rows of P.
+    :param number_courses: Number of rows of Q.
+    :param train: A tuple of arrays (student indices, course indices, ratings) of the training ratings.
+    :param test: A tuple of arrays (student indices, course indices, ratings) of the held-out ratings.
+    :param k: The number of recommendations used to compute precision and recall.
+    :param relevance_threshold: The minimum rating of a relevant course.
+    :param evaluation_interval: Number of epochs between the evaluations of the held-out RMSE.
+    :param patience: Number of evaluations without improvement after which training stops.
+    :param minimum_improvement: The minimum decrease of the held-out RMSE counted as an improvement.
+    :param prune_ratio: If given, training stops once the held-out RMSE exceeds the best one times this ratio.
+    :param best_rmse: A shared value (e.g. ''multiprocessing.Manager().Value'') holding the best RMSE so far.
+    :param best_rmse_lock: A lock shared by the processes updating ''best_rmse'' (e.g.
+    ''multiprocessing.Manager().Lock()'').
+    :param trace_memory: Whether to measure the ''peak_memory'' in a second, traced run.
+    :param random_state: Seed or :class:'numpy.random.Generator' used to initialize the factors.
+    :return: A :class:'Trial' object.
+    """
+    trial = Trial(hyperparameters)
+
+    start = time.perf_counter()
+    _train_and_evaluate(trial, number_students=number_students, number_courses=number_courses, train=train, test=test,
+                        k=k, relevance_threshold=relevance_threshold, evaluation_interval=evaluation_interval,
+                        patience=patience, minimum_improvement=minimum_improvement, prune_ratio=prune_ratio,
+                        best_rmse=best_rmse, random_state=random_state)
+    trial.wall_time = time.perf_counter() - start
+    if resource is not None:
+        trial.max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _train_and_evaluate(Trial(hyperparameters), number_students=number_students, number_courses=number_courses,
+                                train=train, test=test, k=k, relevance_threshold=relevance_threshold,
+                                evaluation_interval=evaluation_interval, patience=patience,
+                                minimum_improvement=minimum_improvement, prune_ratio=prune_ratio, best_rmse=best_rmse,
+                                random_state=random_state)
+            trial.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    if best_rmse is not None:
+        if best_rmse_lock is not None:
+            with best_rmse_lock:
+                best_rmse.value = min(best_rmse.value, trial.rmse)
+        else:
+            best_rmse.value = min(best_rmse.value, trial.rmse)
+    return trial
+
+
+def _train_and_evaluate(trial, *, number_students, number_courses, train, test, k, relevance_threshold,
+                        evaluation_interval, patience, minimum_improvement, prune_ratio, best_rmse, random_state):
+    """Trains the model with the hyperparameters of the ''trial'' and records its errors and metrics in it (see
+    :func:'run_trial').
+    """
+    best = {'rmse': np.inf, 'evaluations': 0}
+
+    def evaluate_epoch(epoch, Q, P, error):
+        trial.training_errors.append(error)
+        if (epoch + 1) % evaluation_interval:
+            return False
+        validation_error = rmse(Q, P, *test)
+        trial.validation_errors.append(validation_error)
+
+        if validation_error < best['rmse'] - minimum_improvement:
+            best['rmse'], best['evaluations'] = validation_error, 0
+        else:
+            best['evaluations'] += 1
+        pruned = prune_ratio is not None and best_rmse is not None and validation_error > prune_ratio * best_rmse.value
+        trial.stopped_early = best['evaluations'] >= patience or pruned
+        return trial.stopped_early
+
+    Q, P, _ = factorize(*train, number_students=number_students, number_courses=number_courses,
+                        random_state=random_state, epoch_callback=evaluate_epoch, **trial.hyperparameters)
+    trial.rmse = rmse(Q, P, *test)
+    trial.precision, trial.recall = precision_recall_at_k(Q, P, train, test, k=k,
+                                                          relevance_threshold=relevance_threshold)
+
+
+def hyperparameter_search(recommendation_system, search_space, *, number_trials=None, processes=None,
+                          test_fraction=0.2, random_state=None, **trial_options):
+    """Evaluates settings of the hyperparameters of :class:'RecommendationSystem'.''train_model'' on held-out ratings,
+    running the trials across a pool of processes. Performs a grid search over all the combinations of the values in
+    ''search_space'', or a random search over ''number_trials'' of them. Each trial runs in a new worker process, so
+    that its ''max_rss'' is not inflated by the trials run before it.
+
+    :param recommendation_system: :class:'RecommendationSystem' object whose known ratings are used.
+    :param search_space: Dictionary mapping the names of the hyperparameters (''regularization_parameter'',
+    ''epochs'', ''learning_rate'', ''number_factors'', ''loss'') to lists of values to try. The ''loss'' values are
+    names of registered losses (see :mod:'losses'); unless searched, every trial minimizes the ''loss_function'' of
+    the recommendation system, as ''train_model'' does.
+    :param number_trials: If given, the number of combinations sampled at random (without replacement).
+    :param processes: The number of worker processes (default: the number of CPUs).
+    :param test_fraction: Fraction of each student's ratings to hold out.
+    :param random_state: Seed used for splitting the ratings, sampling the combinations and initializing the factors.
+    :param trial_options: Keyword arguments passed to :func:'run_trial' (e.g. ''k'', ''patience'', ''prune_ratio'').
+    :return: List of :class:'Trial' objects, sorted by the held-out RMSE.
+    """
+    random_state = np.random.default_rng(random_state)
+    # Read the ratings and their students and courses from the same snapshot, even if a new one is published meanwhile
+    snapshot = recommendation_system.open_snapshot()
+    student_numbers, course_numbers = snapshot.student_numbers, snapshot.course_numbers
+
+    train, test = split_ratings(snapshot.known_ratings_matrix, test_fraction=test_fraction, random_state=random_state)
+    train = index_ratings(train, student_numbers, course_numbers)
+    test = index_ratings(test, student_numbers, course_numbers)
+
+    names = list(search_space)
+    combinations = list(itertools.product(*(search_space[name] for name in names)))
+    if number_trials is not None and number_trials < len(combinations):
+        chosen = random_state.choice(len(combinations), size=number_trials, replace=False)
+        combinations = [combinations[i] for i in chosen]
+    # Unless the loss is searched, the trials minimize the loss the recommendation system is trained with
+    settings = [{'loss': recommendation_system.loss_function, **dict(zip(names, values))} for values in combinations]
+
+    with multiprocessing.Manager() as manager, multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        best_rmse, best_rmse_lock = manager.Value('d', np.inf), manager.Lock()
+        results = [pool.apply_async(run_trial, (hyperparameters, ),
+                                    dict(number_students=len(student_numbers), number_courses=len(course_numbers),
+                                         train=train, test=test, best_rmse=best_rmse, best_rmse_lock=best_rmse_lock,
+                                         random_state=int(random_state.integers(2 ** 32)), **trial_options))
+                   for hyperparameters in settings]
+        trials = [result.get() for result in results]
+
+    return sorted(trials, key=lambda trial: trial.rmse)
@@ -0,0 +1,245 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def resident_memory():
+    """Returns the resident set size of the current process in bytes, or its peak if the current value cannot be read
+    (''None'' if neither is available).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Timer:
+    """A context manager measuring the wall-clock time spent within it, in seconds (attribute ''elapsed'').
+    """
+
+    def __init__(self):
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def stage(instrumentation, name):
+    """Returns a context manager timing the stage ''name'', recorded by ''instrumentation'' unless it is ''None''.
+
+    :param instrumentation: :class:'Instrumentation' object or ''None''.
+    :param name: Name of the stage, e.g. ''train_model.sgd''.
+    :return: A :class:'Timer' object.
+    """
+    if instrumentation is None:
+        return Timer()
+    return instrumentation.stage(name)
+
+
+class _StageTimer(Timer):
+    """A :class:'Timer' reporting to an :class:'Instrumentation' object, profiling the stage if requested."""
+
+    def __init__(self, instrumentation, name):
+        super().__init__()
+        self.instrumentation = instrumentation
+        self.name = name
+        self.profiled = name == instrumentation.profile_stage
+
+    def __enter__(self):
+        if self.profiled:
+            self.instrumentation.profiler.enable()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        if self.profiled:
+            self.instrumentation.profiler.disable()
+        self.instrumentation.record_stage(self.name, self.elapsed)
+        return False
+
+
+class Instrumentation:
+    """Collects the timings of the stages of the :class:'RecommendationSystem' operations (e.g.
+    ''reload_ratings.pivot'', ''train_model.sgd'', ''generate_recommendations.score''), and statistics of each
+    training epoch. Attach it to a recommendation system by setting its ''instrumentation'' attribute.
+
+    :param epoch_callbacks: Callables invoked after each training epoch with a dictionary of the epoch's statistics:
+    ''epoch'', ''loss'', ''seconds'', ''sgd_seconds'', ''loss_seconds'', ''updates_per_second'', ''traced_memory'' and
+    ''peak_traced_memory'' (bytes allocated through Python, if memory is traced) and ''resident_memory'' (bytes).
+    :param trace_memory: Whether to trace the memory allocations with :mod:'tracemalloc' while training (slows the
+    training down).
+    :param profile_stage: Name of a stage to profile with :mod:'cProfile' (e.g. ''train_model.sgd'').
+    :param labels: Dictionary of labels added to every exported Prometheus metric (e.g. {'university': 'uni1'}).
+    """
+
+    def __init__(self, *, epoch_callbacks=(), trace_memory=False, profile_stage=None, labels=None):
+        self.epoch_callbacks = list(epoch_callbacks)
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profiler = cProfile.Profile() if profile_stage is not None else None
+        self.labels = dict(labels or {})
+        self.stages = {}  # Statistics of each stage by name
+        self.epochs = []  # Statistics of each epoch of the last training run
+
+    def add_epoch_callback(self, callback):
+        """Registers a callable invoked after each training epoch with a dictionary of the epoch's statistics."""
+        self.epoch_callbacks.append(callback)
+
+    def stage(self, name):
+        """Returns a context manager timing (and possibly profiling) the stage ''name''.
+
+        :param name: Name of the stage.
+        :return: A :class:'Timer' object.
+        """
+        return _StageTimer(self, name)
+
+    def record_stage(self, name, seconds):
+        """Adds a call of the stage ''name'' which took ''seconds'' to the statistics."""
+        statistics = self.stages.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                   'last_seconds': 0.0})
+        statistics['count'] += 1
+        statistics['total_seconds'] += seconds
+        statistics['max_seconds'] = max(statistics['max_seconds'], seconds)
+        statistics['last_seconds'] = seconds
+
+    def start_training(self):
+        """Resets the epoch statistics, and starts tracing the memory allocations if requested."""
+        self.epochs = []
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def finish_training(self):
+        """Stops tracing the memory allocations if they were traced."""
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def record_epoch(self, *, epoch, loss, sgd_seconds, loss_seconds, updates):
+        """Records the statistics of a training epoch and passes them to the epoch callbacks.
+
+        :param epoch: The number of the epoch (starting with 0).
+        :param loss: The training loss after the epoch.
+        :param sgd_seconds: The time spent applying the updates.
+        :param loss_seconds: The time spent computing the loss.
+        :param updates: The number of updates applied.
+        :return: The dictionary of the epoch's statistics.
+        """
+        seconds = sgd_seconds + loss_seconds
+        traced, peak_traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        statistics = {
+            'epoch': epoch,
+            'loss': float(loss),
+            'seconds': seconds,
+            'sgd_seconds': sgd_seconds,
+            'loss_seconds': loss_seconds,
+            'updates_per_second': updates / sgd_seconds if sgd_seconds > 0 else None,
+            'traced_memory': traced,
+            'peak_traced_memory': peak_traced,
+            'resident_memory': resident_memory(),
+        }
+        self.epochs.append(statistics)
+        for callback in self.epoch_callbacks:
+            callback(statistics)
+        return statistics
+
+    def profile_statistics(self, sort='cumulative', limit=30):
+        """Returns the :mod:'cProfile' report of the profiled stage as text.
+
+        :param sort: The key to sort the report by.
+        :param limit: The number of functions included in the report.
+        :return: The report, or an empty string if the profiled stage has not run yet.
+        """
+        assert self.profiler is not None, 'No stage is being profiled'
+        if self.profile_stage not in self.stages:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump_profile(self, path):
+        """Saves the :mod:'cProfile' statistics of the profiled stage to a file readable by :mod:'pstats'."""
+        assert self.profiler is not None, 'No stage is being profiled'
+        self.profiler.dump_stats(path)
+
+    def to_dict(self):
+        return {'labels': self.labels, 'stages': self.stages, 'epochs': self.epochs}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Returns the statistics in the Prometheus text exposition format."""
+        lines = []
+
+        def add_metric(name, metric_type, description, samples):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                labels = {**self.labels, **labels}
+                formatted_labels = ','.join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f'{name}{{{formatted_labels}}} {value}' if formatted_labels else f'{name} {value}')
+
+        add_metric('recommender_stage_calls_total', 'counter', 'Number of times a stage has run.',
+                   [({'stage': name}, statistics['count']) for name, statistics in self.stages.items()])
+        add_metric('recommender_stage_seconds_total', 'counter', 'Total time spent in a stage.',
+                   [({'stage': name}, statistics['total_seconds']) for name, statistics in self.stages.items()])
+        add_metric('recommender_stage_seconds_max', 'gauge', 'Longest single run of a stage.',
+                   [({'stage': name}, statistics['max_seconds']) for name, statistics in self.stages.items()])
+        add_metric('recommender_stage_seconds_last', 'gauge', 'Duration of the last run of a stage.',
+                   [({'stage': name}, statistics['last_seconds']) for name, statistics in self.stages.items()])
+
+        if self.epochs:
+            last = self.epochs[-1]
+            add_metric('recommender_training_epochs', 'gauge', 'Number of epochs of the last training run.',
+                       [({}, len(self.epochs))])
+            add_metric('recommender_training_loss', 'gauge', 'Training loss after the last epoch.',
+                       [({}, last['loss'])])
+            add_metric('recommender_training_epoch_seconds', 'gauge', 'Duration of the last epoch.',
+                       [({}, last['seconds'])])
+            if last['updates_per_second'] is not None:
+                add_metric('recommender_training_updates_per_second', 'gauge', 'SGD updates per second in the last '
+                           'epoch.', [({}, last['updates_per_second'])])
+            peak_traced = [epoch['peak_traced_memory'] for epoch in self.epochs
+                           if epoch['peak_traced_memory'] is not None]
+            if peak_traced:
+                add_metric('recommender_training_peak_traced_memory_bytes', 'gauge', 'Peak memory allocated '
+                           'through Python during the last training run.', [({}, max(peak_traced))])
+            if last['resident_memory'] is not None:
+                add_metric('recommender_training_resident_memory_bytes', 'gauge', 'Resident memory after the last '
+                           'epoch.', [({}, last['resident_memory'])])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        """Atomically writes the statistics as JSON to the file ''path''."""
+        self._write(path, self.to_json())
+
+    def write_prometheus(self, path):
+        """Atomically writes the statistics in the Prometheus text format to the file ''path'' (e.g. for the node
+        exporter's textfile collector).
+        """
+        self._write(path, self.to_prometheus())
+
+    @staticmethod
+    def _write(path, text):
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write(text)
+        os.replace(temporary_path, path)
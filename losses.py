@@ -0,0 +1,120 @@
+"""Loss functions minimized when training the model of a :class:'RecommendationSystem', registered by name. The name
+is what the recommendation system stores, e.g. ''RecommendationSystem(university=..., loss_function='huber')''.
+
+The kernels of a loss take arrays of residuals (known rating - predicted rating) and of per-rating weights. The
+built-in losses are weighted squared errors, optionally with the residuals clipped (the Huber loss), whose gradient
+the SGD updates compute inline; the gradient of a custom loss is called once per rating instead.
+"""
+
+# Highest rating a student can give a course
+MAXIMUM_RATING = 10
+
+
+class Loss:
+    """Represents a loss function of the residuals of the known ratings, summed over the ratings. Unless the ''value''
+    and the ''gradient'' are given, it is the weighted squared error, quadratic for residuals up to ''clip'' and linear
+    beyond (i.e. the Huber loss) if ''clip'' is given.
+
+    :param name: The identifier of the loss.
+    :param weights: A callable ''weights(ratings)'' returning the weight of each rating, computed once before training.
+    If ''None'', every rating has a weight of 1.
+    :param clip: The absolute residual above which a built-in loss is linear (''None'' for the squared error).
+    :param value: A callable ''value(residuals, weights)'' returning the loss of each rating, for custom losses.
+    :param gradient: A callable ''gradient(residuals, weights)'' returning the derivative of the loss of each rating
+    with respect to its residual (i.e. the negative derivative with respect to the prediction), for custom losses. It
+    must also accept single numbers, as the SGD updates are applied one rating at a time.
+    :param description: A short description of the loss.
+    """
+
+    def __init__(self, name, *, weights=None, clip=None, value=None, gradient=None, description=''):
+        assert (value is None) == (gradient is None), 'Please give both the value and the gradient of a custom loss'
+        assert clip is None or value is None, 'Only the built-in losses can be clipped'
+        self.name = name
+        self.clip = clip
+        self.custom_value = value
+        self.custom_gradient = gradient
+        self._weights = weights
+        self.description = description
+
+    def weights(self, ratings):
+        """Returns the weight of each of the ''ratings''.
+
+        :param ratings: :class:'numpy.ndarray' of the known ratings.
+        :return: :class:'numpy.ndarray' of the same shape.
+        """
+        import numpy as np
+
+        if self._weights is None:
+            return np.ones_like(ratings, dtype=float)
+        return np.asarray(self._weights(ratings), dtype=float)
+
+    def value(self, residuals, weights):
+        """Returns the loss of each rating.
+
+        :param residuals: :class:'numpy.ndarray' of the residuals.
+        :param weights: :class:'numpy.ndarray' of the weights of the ratings.
+        :return: :class:'numpy.ndarray' of the same shape.
+        """
+        import numpy as np
+
+        if self.custom_value is not None:
+            return self.custom_value(residuals, weights)
+        if self.clip is None:
+            return weights * residuals ** 2
+        absolute = np.abs(residuals)
+        return weights * np.where(absolute <= self.clip, residuals ** 2, 2 * self.clip * absolute - self.clip ** 2)
+
+    def gradient(self, residuals, weights):
+        """Returns the derivative of the loss of each rating with respect to its residual.
+
+        :param residuals: :class:'numpy.ndarray' of the residuals.
+        :param weights: :class:'numpy.ndarray' of the weights of the ratings.
+        :return: :class:'numpy.ndarray' of the same shape.
+        """
+        import numpy as np
+
+        if self.custom_gradient is not None:
+            return self.custom_gradient(residuals, weights)
+        if self.clip is None:
+            return 2 * weights * residuals
+        return 2 * weights * np.clip(residuals, -self.clip, self.clip)
+
+    def __repr__(self):
+        return f'Loss({self.name!r})'
+
+
+LOSSES = {}  # Registered losses by name
+
+
+def register_loss(loss):
+    """Registers a :class:'Loss' under its name, replacing any loss registered under the same name.
+
+    :param loss: :class:'Loss' object.
+    :return: The registered :class:'Loss' object.
+    """
+    LOSSES[loss.name] = loss
+    return loss
+
+
+def get_loss(loss):
+    """Returns the registered :class:'Loss' with the given name (or the given :class:'Loss' itself).
+
+    :param loss: Name of a registered loss, or :class:'Loss' object.
+    :return: :class:'Loss' object.
+    """
+    if isinstance(loss, Loss):
+        return loss
+    assert loss in LOSSES, f'Unknown loss function {loss!r}, expected one of {sorted(LOSSES)}'
+    return LOSSES[loss]
+
+
+MSE = register_loss(Loss('mse', description='Squared error'))
+
+# Squared for residuals up to 1, and linear beyond, so that a few ratings the model cannot explain (e.g. a rating given
+# by mistake) do not dominate the training
+HUBER = register_loss(Loss('huber', clip=1.0, description='Squared error up to a residual of 1, absolute error beyond'))
+
+# Weighted so that the mean weight of the ratings spread evenly over the scale is 1, and the highly rated courses (the
+# ones worth recommending) are predicted more accurately than the poorly rated ones
+WEIGHTED_MSE = register_loss(Loss('weighted_mse', weights=lambda ratings: 2 * ratings / (MAXIMUM_RATING + 1),
+                                  description='Squared error weighted by the rating'))
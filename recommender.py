@@ -1,197 +1,630 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Float, PickleType, Enum, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Float, Enum, Boolean, Index
+from sqlalchemy import UniqueConstraint, func, case, and_, exists, select, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, object_session, reconstructor
+from sqlalchemy.orm.attributes import set_committed_value
 
-import numpy as np
-import pandas as pd
-from datetime import date
+# NumPy and pandas are imported by the functions using them, so that the processes which only use the ORM classes
+# (e.g. logins, enrollments) do not pay for loading them (see benchmark_import.py)
+from datetime import date, datetime
 import enum
+import hashlib
+import json
+import os
+import shutil
+import threading
 
-from utils import Base, MSE
+from utils import Base, commit_or_defer, expunge_deleted
+from instrumentation import stage
+from losses import get_loss
+
+# The fields of the records of the binary rating shards read by :func:'factorize_streaming'
+RATING_SHARD_FIELDS = [('student', '<i4'), ('course', '<i4'), ('rating', '<f4')]
 
 
 class RecommendationSystem(Base):
     """Represents the recommendation engine used to make recommendations within the scope of a university.
 
-    :param loss_function: A mathematical function for calculating the cost / loss on training examples (Default = MSE).
-    :param student_course_matrix_path: A path to a .csv file containing the ratings of courses (:class:'Course') added
-    by students (:class:'Student'). The shape of the resulting matrix is |students| x |courses|. If ''None'' is passed,
-    a default value will be set.
-    :param model_parameters_path: A path to a .npz file containing the parameters of the model. If ''None'' is passed,
-    a default value will be set.
+    The files of the recommendation system (the ratings matrices, the course ranking, the model parameters and the
+    table of similar courses) are stored in versioned, immutable snapshot directories within the ''model_directory''.
+    Each call of ''reload_ratings'' or ''train_model'' writes a new snapshot and publishes it by atomically swapping the
+    ''current'' symbolic link, so that readers which have opened a :class:'Snapshot' keep using it until they finish,
+    without any locks. The metadata of each snapshot records the fingerprint of the ratings it was reloaded from and
+    of the model it contains, so that reloading unchanged ratings or retraining an up to date model does nothing.
+
+    :param loss_function: The name of the loss function minimized in training, registered in :mod:'losses' (e.g.
+    ''mse'', ''huber'' or ''weighted_mse''; default ''mse''). Only used when training on the ratings.
+    :param model_directory: A path to the directory containing the snapshots. If ''None'' is passed, a default value
+    will be set.
+    :param student_course_matrix_path: A name of the .csv file, within each snapshot, containing the ratings of courses
+    (:class:'Course') added by students (:class:'Student'). The shape of the resulting matrix is |students| x |courses|.
+    If ''None'' is passed, a default value will be set.
+    :param model_parameters_path: A name of the .npz file, within each snapshot, containing the parameters of the model.
+    If ''None'' is passed, a default value will be set.
+    :param course_ranking_path: A name of the .csv file, within each snapshot, containing the :class:'CourseRanking'
+    used to recommend courses to students missing from the trained model. If ''None'' is passed, a default value will
+    be set.
+    :param retained_snapshots: The number of most recent snapshots kept for rollbacks (default: 5).
     :param university: The :class:'University' object this recommendation system belongs to.
+
+    Set the ''instrumentation'' attribute to an :class:'Instrumentation' object to time the stages of
+    ''reload_ratings'', ''train_model'' and ''generate_recommendations'', and to receive per-epoch training statistics.
     """
     __tablename__ = 'recommendation_system'
 
     id = Column(Integer, primary_key=True)
-    loss_function = Column(PickleType)
+    loss_function = Column(String(40), default='mse')
+    model_directory = Column(String)
     student_course_matrix_path = Column(String)
     known_ratings_matrix_path = Column(String)
     model_parameters_path_Q = Column(String)
     model_parameters_path_P = Column(String)
+    course_ranking_path = Column(String)
     trained = Column(Boolean)
+    model_version = Column(Integer)
+    snapshot_version = Column(String(40))
+    trained_fingerprint = Column(String(40))  # Fingerprint of the ratings the current model was trained on
+    retained_snapshots = Column(Integer)
     university_id = Column(Integer, ForeignKey('university.id'))
 
     university = relationship('University', back_populates='recommendation_system', foreign_keys=[university_id])
 
-    def __init__(self, *, university, loss_function=MSE, student_course_matrix_path=None,
-                 known_ratings_matrix_path=None, model_parameters_path=None):
+    instrumentation = None  # Not persisted
+
+    def __init__(self, *, university, loss_function='mse', model_directory=None, student_course_matrix_path=None,
+                 known_ratings_matrix_path=None, model_parameters_path=None, course_ranking_path=None,
+                 retained_snapshots=5):
         super().__init__()
-        self.loss_function = loss_function
+        self.loss_function = get_loss(loss_function).name
+
+        if model_directory is None:
+            self.model_directory = f'data/{university.username}'  # Default value
+        else:
+            self.model_directory = model_directory
 
         if student_course_matrix_path is None:
-            self.student_course_matrix_path = f'data/{university.username}_student_course.csv'  # Default value
+            self.student_course_matrix_path = 'student_course.csv'  # Default value
         else:
-            self.student_course_matrix_path = student_course_matrix_path
+            self.student_course_matrix_path = os.path.basename(student_course_matrix_path)
 
         if known_ratings_matrix_path is None:
-            self.known_ratings_matrix_path = f'data/{university.username}_known_ratings.csv'  # Default value
+            self.known_ratings_matrix_path = 'known_ratings.csv'  # Default value
         else:
-            self.known_ratings_matrix_path = known_ratings_matrix_path
+            self.known_ratings_matrix_path = os.path.basename(known_ratings_matrix_path)
 
         if model_parameters_path is None:
-            self.model_parameters_path_Q = f'data/{university.username}_model_parameters_Q.npz'  # Default value
-            self.model_parameters_path_P = f'data/{university.username}_model_parameters_P.npz'  # Default value
+            self.model_parameters_path_Q = 'model_parameters_Q.npz'  # Default value
+            self.model_parameters_path_P = 'model_parameters_P.npz'  # Default value
+        else:
+            self.model_parameters_path_Q = f'Q_{os.path.basename(model_parameters_path)}'
+            self.model_parameters_path_P = f'P_{os.path.basename(model_parameters_path)}'
+
+        if course_ranking_path is None:
+            self.course_ranking_path = 'course_ranking.csv'  # Default value
         else:
-            self.model_parameters_path_Q = f'Q_{model_parameters_path}'
-            self.model_parameters_path_P = f'P_{model_parameters_path}'
+            self.course_ranking_path = os.path.basename(course_ranking_path)
 
         self.university = university
         self.trained = False
-        # Create an empty matrix and save it to a file (recommendation system is created with a university
-        # automatically - no ratings to reload yet).
-        empty_matrix = pd.DataFrame()
-        empty_matrix.to_csv(self.student_course_matrix_path, index=False)
-        empty_matrix.to_csv(self.known_ratings_matrix_path, index=False)
+        self.model_version = 0
+        self.retained_snapshots = retained_snapshots
+        # Publish a snapshot of empty matrices (recommendation system is created with a university automatically - no
+        # ratings to reload yet). The files are written without pandas, which is only imported once the ratings are
+        # reloaded, the model is trained or recommendations are generated.
+        self.publish_snapshot({name: lambda path: open(path, 'w').close()
+                               for name in (self.student_course_matrix_path, self.known_ratings_matrix_path,
+                                            self.course_ranking_path)},
+                              inherit=False)
+
+    @reconstructor
+    def _upgrade_loss_function(self):
+        # The databases created before the losses were registered by name store a pickled callable, which was never
+        # used: the model was always trained with the squared error
+        if isinstance(self.loss_function, (bytes, memoryview)):
+            set_committed_value(self, 'loss_function', 'mse')
 
     @property
     def student_course_matrix(self):
-        try:
-            return pd.read_csv(self.student_course_matrix_path, index_col='student_number')\
-                .rename_axis('course_number', axis=1)
-        except pd.errors.EmptyDataError:
-            return None
+        return self.open_snapshot().student_course_matrix
 
     @property
     def known_ratings_matrix(self):
-        try:
-            return pd.read_csv(self.known_ratings_matrix_path, header=None)
-        except pd.errors.EmptyDataError:
-            return None
+        return self.open_snapshot().known_ratings_matrix
+
+    @property
+    def enrollments(self):
+        return self.open_snapshot().enrollments
 
     @property
     def parameters(self):
+        return self.open_snapshot().parameters
+
+    @property
+    def course_ranking(self):
+        return self.open_snapshot().course_ranking
+
+    @property
+    def course_scorer(self):
+        return self.open_snapshot().course_scorer
+
+    @property
+    def _snapshots_directory(self):
+        return os.path.join(self.model_directory, 'snapshots')
+
+    @property
+    def _current_link(self):
+        return os.path.join(self.model_directory, 'current')
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.model_directory, 'checkpoint.npz')
+
+    @property
+    def _streaming_directory(self):
+        return os.path.join(self.model_directory, 'streaming')
+
+    def _rating_shards(self, snapshot, shard_size):
+        """Returns the paths to the binary shards of the known ratings of the ''snapshot'', writing them if they have
+        not been written yet. The shards of the other snapshots are removed.
+        """
+        shards_directory = os.path.join(self.model_directory, 'shards')
+        os.makedirs(shards_directory, exist_ok=True)
+        for name in os.listdir(shards_directory):
+            if name != snapshot.version and not name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(shards_directory, name), ignore_errors=True)
+        return write_rating_shards(snapshot.known_ratings_matrix_path, os.path.join(shards_directory, snapshot.version),
+                                   snapshot.student_numbers, snapshot.course_numbers, shard_size)
+
+    def open_snapshot(self, version=None):
+        """Opens the currently published (or the given) snapshot. The returned :class:'Snapshot' object keeps reading
+        the same version of the files, even if newer snapshots are published in the meantime.
+
+        :param version: The version of the snapshot to open. If ''None'', the current snapshot is opened.
+        :return: :class:'Snapshot' object, or ''None'' if no snapshot has been published yet.
+        """
+        if version is None:
+            try:
+                version = os.path.basename(os.readlink(self._current_link))
+            except FileNotFoundError:
+                return None
+        return Snapshot(self, os.path.join(self._snapshots_directory, version))
+
+    def snapshot_versions(self):
+        """Returns the versions of the stored snapshots, oldest first.
+
+        :return: List of version identifiers.
+        """
         try:
-            Q = pd.read_csv(self.model_parameters_path_Q, index_col='course_number')
-            P = pd.read_csv(self.model_parameters_path_P, index_col='student_number')
-            return Q, P
-        except pd.errors.EmptyDataError:
-            return None
+            return sorted(name for name in os.listdir(self._snapshots_directory) if not name.startswith('.'))
+        except FileNotFoundError:
+            return []
+
+    def _latest_model_version(self):
+        """Returns the highest version of a model trained so far, according to the ''model_version'' and the metadata
+        of the stored snapshots (which a rollback may have made newer than the current one).
+        """
+        versions = [self.model_version or 0]
+        for version in self.snapshot_versions():
+            try:
+                versions.append(self.open_snapshot(version).metadata.get('model_version') or 0)
+            except FileNotFoundError:  # Pruned in the meantime
+                pass
+        return max(versions)
 
-    def reload_ratings(self):
+    def publish_snapshot(self, files, inherit=True, **metadata):
+        """Writes a new snapshot and atomically makes it the current one. The files are written to a hidden staging
+        directory, which is renamed once complete, after which the ''current'' symbolic link is replaced by a link to
+        it with a single rename. Finally, the snapshots beyond the ''retained_snapshots'' most recent ones are removed.
+
+        :param files: Dictionary mapping the file names to callables which write the file to the given path.
+        :param inherit: Whether to include the files (hard linked, or copied where links are not supported) and the
+        metadata of the current snapshot which are not overwritten by ''files''.
+        :param metadata: Values recorded in the metadata of the snapshot (e.g. the hyperparameters of the model).
+        :return: The version of the published snapshot.
+        """
+        os.makedirs(self._snapshots_directory, exist_ok=True)
+        # Versions sort in the order of publication
+        version = f'{datetime.utcnow():%Y%m%d%H%M%S%f}-{os.getpid()}-{threading.get_ident() % 10000:04d}'
+        staging_directory = os.path.join(self._snapshots_directory, f'.{version}')
+        os.makedirs(staging_directory)
+
+        for name, write in files.items():
+            write(os.path.join(staging_directory, name))
+
+        current = self.open_snapshot() if inherit else None
+        if current is not None:
+            metadata = {**current.metadata, **metadata}
+            for name in os.listdir(current.directory):
+                if name in files or name == Snapshot.METADATA_FILE:
+                    continue
+                try:
+                    os.link(current.path(name), os.path.join(staging_directory, name))
+                except OSError:
+                    shutil.copy2(current.path(name), os.path.join(staging_directory, name))
+
+        metadata.update(version=version, published=datetime.utcnow().isoformat(), trained=bool(self.trained))
+        # The version of the model the files were trained by, unless a new model is published
+        metadata.setdefault('model_version', 0)
+        with open(os.path.join(staging_directory, Snapshot.METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging_directory, os.path.join(self._snapshots_directory, version))
+
+        self._point_current_to(version)
+        self.prune_snapshots()
+        return version
+
+    def _point_current_to(self, version):
+        """Atomically replaces the ''current'' symbolic link by a link to the snapshot ''version''."""
+        temporary_link = f'{self._current_link}.{version}'
+        os.symlink(os.path.join('snapshots', version), temporary_link)
+        os.replace(temporary_link, self._current_link)
+        self.snapshot_version = version
+
+    def rollback(self, version=None):
+        """Makes a previously published snapshot the current one again. The ''trained'' flag is restored from the
+        metadata of the snapshot, whereas the ''model_version'' is not: the recommendations record the version of the
+        model of the snapshot they are generated from, and the next trained model gets a version never used before.
+
+        :param version: The version of the snapshot to roll back to. If ''None'', the snapshot published before the
+        current one is used.
+        :return: The version of the current snapshot.
+        """
+        versions = self.snapshot_versions()
+        if version is None:
+            current = self.open_snapshot()
+            older = [v for v in versions if current is None or v < current.version]
+            assert older, 'There is no older snapshot to roll back to'
+            version = older[-1]
+        assert version in versions, f'There is no snapshot with version {version}'
+
+        metadata = self.open_snapshot(version).metadata
+        self._point_current_to(version)
+        self.trained = metadata.get('trained', False)
+        self.trained_fingerprint = metadata.get('trained_on')
+        return version
+
+    def prune_snapshots(self, retained_snapshots=None):
+        """Removes all but the most recent snapshots. The current snapshot is never removed, nor is the snapshot an
+        interrupted training run is checkpointed on, so that the run can be resumed however many snapshots are
+        published in the meantime.
+
+        :param retained_snapshots: The number of most recent snapshots to keep (default: ''retained_snapshots'').
+        """
+        if retained_snapshots is None:
+            retained_snapshots = self.retained_snapshots or 1
+        current = self.open_snapshot()
+        protected = {current.version if current is not None else None,
+                     Checkpoint.snapshot_version_of(self._checkpoint_path)}
+        for version in self.snapshot_versions()[:-retained_snapshots]:
+            if version not in protected:
+                shutil.rmtree(os.path.join(self._snapshots_directory, version), ignore_errors=True)
+
+    @classmethod
+    def ratings_fingerprints(cls, session, university_ids=None):
+        """Computes the fingerprints of the ratings of universities: a hash of the contents of their courses
+        (identifier, course number, semester of availability and whether it is elective) and enrollments (student
+        identifier and student number, course identifier, start date and rating), read in a fixed order by two queries
+        of these columns only. The fingerprint changes whenever any of them is added, modified or removed.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param university_ids: The ids of the universities whose fingerprints to compute. If ''None'', the
+        fingerprints of all universities with at least one course are computed.
+        :return: Dictionary mapping the university ids to tuples (fingerprint, number of ratings).
+        """
+        from university import Course
+        from student import Student, StudentCourse
+
+        students = Student.__table__
+        courses = session.query(Course.university_id, Course.id, Course.course_number, Course.semester_of_availability,
+                                Course.is_elective)\
+            .order_by(Course.university_id, Course.id)
+        enrollments = session.query(Course.university_id, StudentCourse.student_id, students.c.student_number,
+                                    StudentCourse.course_id, StudentCourse.start_date, StudentCourse.course_rating)\
+            .select_from(StudentCourse)\
+            .join(Course, StudentCourse.course_id == Course.id)\
+            .join(students, StudentCourse.student_id == students.c.id)\
+            .order_by(Course.university_id, StudentCourse.student_id, StudentCourse.course_id,
+                      StudentCourse.start_date)
+        if university_ids is not None:
+            courses = courses.filter(Course.university_id.in_(university_ids))
+            enrollments = enrollments.filter(Course.university_id.in_(university_ids))
+
+        digests, number_ratings = {}, {}
+        for university_id, *values in courses.yield_per(10000):
+            digests.setdefault(university_id, hashlib.sha1()).update(repr(values).encode())
+            number_ratings.setdefault(university_id, 0)
+        for university_id, *values in enrollments.yield_per(10000):
+            digests[university_id].update(repr(values).encode())
+            number_ratings[university_id] += values[-1] is not None
+        return {university_id: (digest.hexdigest(), number_ratings[university_id])
+                for university_id, digest in digests.items()}
+
+    def ratings_fingerprint(self):
+        """Computes the fingerprint of the ratings of the university this recommendation system belongs to (see
+        ''ratings_fingerprints'').
+
+        :return: The fingerprint (a string).
+        """
+        fingerprints = RecommendationSystem.ratings_fingerprints(object_session(self), [self.university_id])
+        return fingerprints.get(self.university_id, (hashlib.sha1().hexdigest(), 0))[0]
+
+    @classmethod
+    def stale(cls, session):
+        """Retrieves the recommendation systems whose models have not been trained on the current ratings of their
+        universities (including the ones never trained), i.e. the ones which need to reload the ratings and retrain the
+        model. The fingerprints of the ratings of all universities are computed with two queries, reading far less
+        than reloading the ratings would. Recommendation systems of universities without any ratings are not included.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :return: List of :class:'RecommendationSystem' objects, ordered by their ''university_id'' attributes.
+        """
+        fingerprints = cls.ratings_fingerprints(session)
+        return [recommendation_system
+                for recommendation_system in session.query(cls).order_by(cls.university_id.asc())
+                if fingerprints.get(recommendation_system.university_id, (None, 0))[1] > 0 and
+                recommendation_system.trained_fingerprint != fingerprints[recommendation_system.university_id][0]]
+
+    def reload_ratings(self, force=False):
         """Retrieves all enrollments in courses offered at the university this recommendation system belongs to,
-        converts them to pandas :class:'DataFrame' objects and saves them to .csv files. The matrices can be read
-        using the instance attributes ''student_course_matrix'' and ''known_ratings_matrix''.
+        converts them to pandas :class:'DataFrame' objects and publishes them as .csv files in a new snapshot. The
+        matrices can be read using the instance attributes ''student_course_matrix'' and ''known_ratings_matrix''. All
+        the enrollments, including the ones which have not been rated (used to train the model with implicit feedback),
+        can be read using ''enrollments''. The
+        :class:'CourseRanking' of all the courses offered at the university, used for students and courses missing from
+        the trained model, is rebuilt as well and can be read using the instance attribute ''course_ranking''.
+
+        Nothing is retrieved or published if the fingerprint of the ratings (see ''ratings_fingerprints'') is the one
+        recorded in the current snapshot.
+
+        :param force: Whether to reload the ratings even if they have not changed.
+        :return: Whether a new snapshot has been published.
         """
+        # Fingerprint the ratings before retrieving them, so that a change made in between is reloaded next time
+        with stage(self.instrumentation, 'reload_ratings.fingerprint'):
+            fingerprint = self.ratings_fingerprint()
+            snapshot = self.open_snapshot()
+            if not force and snapshot is not None and snapshot.metadata.get('ratings_fingerprint') == fingerprint:
+                return False
+
+        import pandas as pd
+
         # Retrieve all enrollments
-        admissions = []
-        for course in self.university.courses:
-            for admission in course.admissions:
-                admissions.append([admission.student.student_number, admission.course.course_number,
-                                   admission.course_rating])
+        with stage(self.instrumentation, 'reload_ratings.query'):
+            admissions = []
+            for course in self.university.courses:
+                for admission in course.admissions:
+                    admissions.append([admission.student.student_number, admission.course.course_number,
+                                       admission.course_rating])
+            courses = [[course.course_number, course.semester_of_availability, bool(course.is_elective)]
+                       for course in self.university.courses]
+
+        # Extract a ''student_course_matrix'' and a ''known_ratings_matrix'', and rank all the courses, including the
+        # ones nobody has enrolled in yet
+        with stage(self.instrumentation, 'reload_ratings.pivot'):
+            long_df = pd.DataFrame(admissions, columns=['student_number', 'course_number', 'rating'])
+            student_course_matrix = long_df.pivot(index='student_number', columns='course_number', values='rating')
+            known_ratings_matrix = long_df.dropna()
+            courses = pd.DataFrame(courses, columns=['course_number', 'semester_of_availability', 'is_elective'])
+            course_ranking = CourseRanking.from_enrollments(long_df, courses)
+
+        # Publish them in a new snapshot, along with the current model parameters
+        with stage(self.instrumentation, 'reload_ratings.write'):
+            self.publish_snapshot({
+                self.student_course_matrix_path: lambda path: student_course_matrix.to_csv(path, index=True),
+                self.known_ratings_matrix_path: lambda path: known_ratings_matrix.to_csv(path, index=False,
+                                                                                         header=False),
+                self.course_ranking_path: course_ranking.save,
+                Snapshot.ENROLLMENTS_FILE: lambda path: long_df.to_csv(path, index=False, header=False),
+            }, ratings_fingerprint=fingerprint)
+        return True
+
+    def remove(self, *, student_numbers=(), course_numbers=(), enrollments=()):
+        """Removes students and courses from the ratings, the course ranking and the trained model, and publishes the
+        result in a new snapshot. The model is not retrained: the factors of the remaining students and courses are
+        kept, so the recommendations made to the remaining students only change by no longer including the removed
+        courses.
+
+        :param student_numbers: Student numbers of the removed students.
+        :param course_numbers: Course numbers of the removed courses.
+        :param enrollments: Pairs (student number, course number) of the removed enrollments of the remaining courses,
+        rated or not, used to update the numbers of enrollments in the course ranking.
+        :return: The version of the published snapshot, or ''None'' if no snapshot has been published yet.
+        """
+        import pandas as pd
+
+        snapshot = self.open_snapshot()
+        if snapshot is None:
+            return None
+        student_numbers = [str(student_number) for student_number in student_numbers]
+        course_numbers = [str(course_number) for course_number in course_numbers]
+        files = {}
+
+        student_course_matrix = snapshot.student_course_matrix
+        if student_course_matrix is not None:
+            student_course_matrix = student_course_matrix.drop(index=student_numbers, columns=course_numbers,
+                                                               errors='ignore')
+            files[self.student_course_matrix_path] = lambda path: student_course_matrix.to_csv(path, index=True)
+
+        known_ratings_matrix = snapshot.known_ratings_matrix
+        ratings = None
+        if known_ratings_matrix is not None:
+            known_ratings_matrix = known_ratings_matrix[~known_ratings_matrix[0].isin(student_numbers) &
+                                                        ~known_ratings_matrix[1].isin(course_numbers)]
+            ratings = known_ratings_matrix[[1, 2]].set_axis(['course_number', 'rating'], axis=1)
+            files[self.known_ratings_matrix_path] = lambda path: known_ratings_matrix.to_csv(path, index=False,
+                                                                                             header=False)
+
+        all_enrollments = snapshot.enrollments
+        if all_enrollments is not None:
+            all_enrollments = all_enrollments[~all_enrollments[0].isin(student_numbers) &
+                                              ~all_enrollments[1].isin(course_numbers)]
+            files[Snapshot.ENROLLMENTS_FILE] = lambda path: all_enrollments.to_csv(path, index=False, header=False)
 
-        # Extract a ''student_course_matrix'' and a ''known_ratings_matrix'', then save them to appropriate files
-        long_df = pd.DataFrame(admissions, columns=['student_number', 'course_number', 'rating'])
-        student_course_matrix = long_df.pivot(index='student_number', columns='course_number', values='rating')
-        known_ratings_matrix = long_df.dropna()
+        course_ranking = snapshot.course_ranking
+        if course_ranking is not None:
+            enrollments = pd.DataFrame(list(enrollments), columns=['student_number', 'course_number'], dtype=str)
+            course_ranking = course_ranking.without(course_numbers, enrollments, ratings)
+            files[self.course_ranking_path] = course_ranking.save
 
-        student_course_matrix.to_csv(self.student_course_matrix_path, index=True)
-        known_ratings_matrix.to_csv(self.known_ratings_matrix_path, index=False, header=False)
+        parameters = snapshot.parameters
+        if parameters is not None:
+            Q = parameters[0].drop(index=course_numbers, errors='ignore')
+            P = parameters[1].drop(index=student_numbers, errors='ignore')
+            files[self.model_parameters_path_Q] = lambda path: Q.to_csv(path, index=True)
+            files[self.model_parameters_path_P] = lambda path: P.to_csv(path, index=True)
+
+        course_neighbours = snapshot.course_neighbours
+        if course_neighbours is not None and course_numbers:
+            files[Snapshot.COURSE_NEIGHBOURS_FILE] = course_neighbours.without(course_numbers).save
+
+        # The ratings no longer match the ones in the database the snapshot was reloaded from
+        return self.publish_snapshot(files, ratings_fingerprint=None)
 
     def train_model(self, *, regularization_parameter=0.1, epochs=40, learning_rate=0.015,
-                    number_factors=20, thread_errors=None):
-        """Trains the model using stochastic gradient descent, by minimizing the L2 regularized sum of squares error
-         of known ratings reconstruction. The ratings are reconstructed by ratings matrix factorization into 2 parameter
-         matrices.
+                    number_factors=20, number_neighbours=10, implicit=False, confidence_weight=40, cg_steps=3,
+                    checkpoint_interval=1, resume=False, streaming=False, memory_budget=256 * 2 ** 20,
+                    force=False, thread_errors=None):
+        """Trains the model using stochastic gradient descent, by minimizing the L2 regularized loss (''loss_function'',
+         the sum of squares error by default) of known ratings reconstruction. The ratings are reconstructed by ratings
+         matrix factorization into 2 parameter matrices.
+
+        With ''implicit'' feedback, every enrollment (rated or not) is used instead, as an observed preference for the
+        course weighted by a confidence, and the model is trained with weighted alternating least squares (see
+        :func:'factorize_implicit'). The scores of such a model are predicted preferences in [0, 1] rather than
+        ratings.
+
+        Every ''checkpoint_interval'' epochs, the factors, the epoch, the state of the random number generator and the
+        errors so far are saved to a :class:'Checkpoint' in the ''model_directory'', which is removed once the model is
+        published. With ''resume'', an interrupted run is continued from its checkpoint, provided it was started with
+        the same hyperparameters and the ratings it was started on are still stored; otherwise a new run is started.
+
+        With ''streaming'', the ratings and the factors are not loaded into memory (see :func:'factorize_streaming'):
+        the known ratings are converted into binary shards once per snapshot, and read from them in shuffled blocks
+        sized by the ''memory_budget''. Streaming runs are not checkpointed.
+
+        The model is not retrained if the current one was trained on the ratings of the current snapshot with the same
+        hyperparameters (and loss function), as recorded in the metadata of the snapshot.
 
         :param regularization_parameter: L2 regularization coefficient.
         :param epochs: Number of epochs (iterations) to run SGD for.
         :param learning_rate: SGD learning rate parameter.
         :param number_factors: The number of factors used for ratings matrix factorization (i.e. one of the sizes of the
         factoring matrices).
+        :param number_neighbours: The number of most similar courses stored for each course, available through
+        ''similar_courses''.
+        :param implicit: Whether to train on all the enrollments as implicit feedback, instead of the ratings.
+        :param confidence_weight: Implicit feedback only - the confidence of an enrollment is 1 + ''confidence_weight''.
+        :param cg_steps: Implicit feedback only - the number of conjugate gradient steps used to update each row of the
+        factors per epoch.
+        :param checkpoint_interval: The number of epochs between checkpoints (''None'' to disable checkpointing).
+        :param resume: Whether to continue the interrupted run from its checkpoint, if there is one.
+        :param streaming: Whether to train on the ratings read from memory mapped shards, a block at a time.
+        :param memory_budget: Streaming only - the approximate number of bytes used by a block of ratings and the
+        factors it touches.
+        :param force: Whether to retrain the model even if it is up to date.
         :param thread_errors: Saves the errors on each epoch to this mutable parameter. Use only with threading.
-        :return: The errors on each learning epoch.
+        :return: The errors on each learning epoch (an empty list if the model was up to date).
         """
-        student_course_matrix = self.student_course_matrix
-        number_students, number_courses = student_course_matrix.shape
-        student_numbers = student_course_matrix.index
-        course_numbers = student_course_matrix.columns
+        import numpy as np
 
-        # Initialize the decomposition matrices to random values in [ 0, sqrt(10/nr_factors) ), and save them as
-        # :class:'DataFrame's indexed by student numbers or course numbers (depending on which matrix)
-        init_high = np.sqrt(10 / number_factors)
-        Q = pd.DataFrame(np.random.uniform(low=0.0, high=init_high, size=(number_courses, number_factors)),
-                         index=course_numbers)
-        P = pd.DataFrame(np.random.uniform(low=0.0, high=init_high, size=(number_students, number_factors)),
-                         index=student_numbers)
-
-        errors = []  # Errors on each iteration
-
-        # -- Training on the known ratings --
-        with open(self.known_ratings_matrix_path) as f:
-            for epoch in range(epochs):
-                # -- Compute and apply SGD updates for each training example --
-                for line in f:
-                    student_number, course_number, rating = tuple(s for s in line.split(','))
-                    rating = float(rating)
-
-                    # Retrieve rows corresponding to the current student-course pair
-                    q = Q.loc[course_number]
-                    p = P.loc[student_number]
-
-                    # Compute a common error term
-                    epsilon = 2 * (rating - np.dot(q, p))
-
-                    # Compute SGD updates
-                    q_update = learning_rate * ((epsilon * p) - (2 * regularization_parameter * q))
-                    p_update = learning_rate * ((epsilon * q) - (2 * regularization_parameter * p))
-
-                    # Apply SGD updates
-                    q = q + q_update
-                    p = p + p_update
-
-                    # Update the appropriate rows in decomposition matrices
-                    Q.loc[course_number] = q
-                    P.loc[student_number] = p
-
-                # -- Compute the training set error on the current iteration --
-                E = 0
-                # Move file iterator to the first line
-                f.seek(0)
-                for line in f:
-                    student_number, course_number, rating = tuple(s for s in line.split(','))
-                    rating = float(rating)
-
-                    # Retrieve rows corresponding to the current student-course pair
-                    q = Q.loc[course_number]
-                    p = P.loc[student_number]
-
-                    # Compare the predicted rating to the known one, and add this to the error term
-                    E += (rating - np.dot(q, p)) ** 2
-
-                # Add the regularization terms
-                E += regularization_parameter * sum(Q.apply(lambda row: sum([term ** 2 for term in row])))
-                E += regularization_parameter * sum(P.apply(lambda row: sum([term ** 2 for term in row])))
-                # Save error on the current iteration
-                errors.append(E)
-                # Move the file iterator to the first line (before the next epoch)
-                f.seek(0)
-
-        # Save the parameters
-        Q.to_csv(self.model_parameters_path_Q, index=True)
-        P.to_csv(self.model_parameters_path_P, index=True)
-
-        # Set to trained mode to enable generating recommendations
+        instrumentation = self.instrumentation
+        hyperparameters = dict(regularization_parameter=regularization_parameter, epochs=epochs,
+                               number_factors=number_factors,
+                               **(dict(confidence_weight=confidence_weight, cg_steps=cg_steps) if implicit
+                                  else dict(learning_rate=learning_rate, loss_function=self.loss_function)))
+        with stage(instrumentation, 'train_model.load'):
+            snapshot = self.open_snapshot()
+            model_fingerprint = _fingerprint(snapshot.metadata.get('ratings_fingerprint'), implicit, hyperparameters)
+            if not force and self.trained and snapshot.metadata.get('ratings_fingerprint') is not None and \
+                    snapshot.metadata.get('model_fingerprint') == model_fingerprint:
+                return []
+            checkpoint = Checkpoint.load(self._checkpoint_path) if resume and not streaming else None
+            if checkpoint is not None and (checkpoint.hyperparameters != dict(hyperparameters, implicit=implicit) or
+                                           checkpoint.snapshot_version not in self.snapshot_versions()):
+                checkpoint = None
+            if checkpoint is not None:
+                # Train on the ratings the interrupted run was started on
+                snapshot = self.open_snapshot(checkpoint.snapshot_version)
+                model_fingerprint = _fingerprint(snapshot.metadata.get('ratings_fingerprint'), implicit,
+                                                 hyperparameters)
+            if streaming:
+                assert not implicit, 'Streaming is only supported when training on the ratings'
+                student_numbers, course_numbers = snapshot.student_numbers, snapshot.course_numbers
+                shard_paths = self._rating_shards(snapshot, streaming_block_size(memory_budget, number_factors))
+            else:
+                student_course_matrix = snapshot.student_course_matrix
+                student_numbers = student_course_matrix.index
+                course_numbers = student_course_matrix.columns
+            if implicit:
+                enrollments = snapshot.enrollments
+                assert enrollments is not None or student_course_matrix.empty, \
+                    'Please reload the ratings before training the model with implicit feedback'
+                student_indices, course_indices, _ = index_ratings(enrollments, student_numbers, course_numbers)
+            elif not streaming:
+                student_indices, course_indices, ratings = index_ratings(snapshot.known_ratings_matrix,
+                                                                         student_numbers, course_numbers)
+
+        def save_checkpoint(epoch, Q, P, errors, random_state):
+            if checkpoint_interval and (epoch + 1) % checkpoint_interval == 0 and epoch + 1 < epochs:
+                with stage(instrumentation, 'train_model.checkpoint'):
+                    Checkpoint(Q=Q, P=P, errors=errors, epoch=epoch, random_state=random_state.bit_generator.state,
+                               hyperparameters=dict(hyperparameters, implicit=implicit),
+                               snapshot_version=snapshot.version).save(self._checkpoint_path)
+
+        if instrumentation is not None:
+            instrumentation.start_training()
+        try:
+            if implicit:
+                Q, P, errors = factorize_implicit(student_indices, course_indices,
+                                                  np.full(len(student_indices), 1.0 + confidence_weight),
+                                                  number_students=len(student_numbers),
+                                                  number_courses=len(course_numbers),
+                                                  regularization_parameter=regularization_parameter, epochs=epochs,
+                                                  number_factors=number_factors, cg_steps=cg_steps,
+                                                  resume_from=checkpoint, checkpoint_callback=save_checkpoint,
+                                                  instrumentation=instrumentation)
+            elif streaming:
+                Q, P, errors = factorize_streaming(shard_paths, number_students=len(student_numbers),
+                                                   number_courses=len(course_numbers),
+                                                   work_directory=self._streaming_directory,
+                                                   regularization_parameter=regularization_parameter, epochs=epochs,
+                                                   learning_rate=learning_rate, number_factors=number_factors,
+                                                   loss=self.loss_function, memory_budget=memory_budget,
+                                                   instrumentation=instrumentation)
+            else:
+                Q, P, errors = factorize(student_indices, course_indices, ratings,
+                                         number_students=len(student_numbers), number_courses=len(course_numbers),
+                                         regularization_parameter=regularization_parameter, epochs=epochs,
+                                         learning_rate=learning_rate, number_factors=number_factors,
+                                         loss=self.loss_function, resume_from=checkpoint,
+                                         checkpoint_callback=save_checkpoint, instrumentation=instrumentation)
+        finally:
+            if instrumentation is not None:
+                instrumentation.finish_training()
+
+        # Set to trained mode to enable generating recommendations, and mark the recommendations generated from now on
+        # as coming from a new version of the model
         self.trained = True
+        self.model_version = self._latest_model_version() + 1
+        self.trained_fingerprint = snapshot.metadata.get('ratings_fingerprint')
+
+        with stage(instrumentation, 'train_model.neighbours'):
+            course_neighbours = CourseNeighbours.from_factors(Q, course_numbers, number_neighbours)
+
+        # Publish the parameters as :class:'DataFrame's indexed by student numbers or course numbers (depending on
+        # which matrix) in a new snapshot, along with the current ratings
+        with stage(instrumentation, 'train_model.write'):
+            self.publish_snapshot({
+                self.model_parameters_path_Q: lambda path: _write_factors(path, Q, course_numbers),
+                self.model_parameters_path_P: lambda path: _write_factors(path, P, student_numbers),
+                Snapshot.COURSE_NEIGHBOURS_FILE: course_neighbours.save,
+            }, feedback='implicit' if implicit else 'explicit', hyperparameters=hyperparameters,
+                model_version=self.model_version, model_fingerprint=model_fingerprint,
+                trained_on=self.trained_fingerprint)
+        Checkpoint.remove(self._checkpoint_path)
+        if streaming:
+            del Q, P
+            shutil.rmtree(self._streaming_directory, ignore_errors=True)
 
         # Save the values in the thread in case of parallel execution
         if thread_errors is not None:
@@ -199,7 +632,8 @@ class RecommendationSystem(Base):
 
         return errors
 
-    def generate_recommendations(self, student, session, number_recommendations=3):
+    def generate_recommendations(self, student, session, number_recommendations=3, electives_only=True,
+                                 eligible_only=False):
         """Generates recommendations based on the course ratings added by a ''student''.
 
         :param student: :class:'Student' object for which to generate the recommendations.
@@ -207,30 +641,1123 @@ class RecommendationSystem(Base):
         :param number_recommendations: The maximum number of recommendations to generate. If the number of
         :class:'Course' objects associated with  this system's :class:'University' object is less than the ''number''
         parameter, a recommendation for each course available at this university will be returned.
+        :param electives_only: Whether to only recommend elective courses (default: True).
+        :param eligible_only: Whether to only recommend courses available in a semester the student has not completed
+        yet (default: False).
         :return: A tuple of :class:'Recommendation' objects
+
+        Students missing from the trained model (e.g. registered since it was last trained) are recommended the most
+        popular courses from the :class:'CourseRanking'. Courses added since the model was last trained are scored by
+        their mean rating.
         """
+        return self.generate_batch_recommendations([student], session, number_recommendations=number_recommendations,
+                                                   electives_only=electives_only, eligible_only=eligible_only)[0]
+
+    def generate_batch_recommendations(self, students, session, number_recommendations=3, electives_only=True,
+                                       eligible_only=False):
+        """Generates recommendations for many students at once. The students are scored in cohorts of the same number
+        of completed terms, each cohort with a single matrix product, after which the courses excluded by the
+        constraints or already enrolled in are masked out before the top courses are selected.
+
+        :param students: List of :class:'Student' objects for which to generate the recommendations.
+        :param session: SQLAlchemy :class:'Session' object allowing to issue queries against the database.
+        :param number_recommendations: The maximum number of recommendations to generate for each student.
+        :param electives_only: Whether to only recommend elective courses (default: True).
+        :param eligible_only: Whether to only recommend courses available in a semester the student has not completed
+        yet (default: False).
+        :return: A list of lists of :class:'Recommendation' objects, one for each of the ''students''. The new
+        recommendations are flushed, but not committed.
+        """
+        import numpy as np
+
         assert number_recommendations in range(1, 4), 'The number of generated recommendations must be within [1, 3]'
-        assert self.trained, 'Please train the model at least once before generating a recommendation'
+        instrumentation = self.instrumentation
+        # Read all the files from the same snapshot, even if a new one is published in the meantime
+        with stage(instrumentation, 'generate_recommendations.load'):
+            snapshot = self.open_snapshot()
+            # The version of the model which scores the courses, older than the latest one after a rollback
+            model_version = snapshot.metadata.get('model_version')
+            course_ranking = snapshot.course_ranking
+            assert course_ranking is not None, \
+                'Please reload the ratings at least once before generating a recommendation'
+            course_scorer = snapshot.course_scorer
+        course_numbers = course_ranking.courses.index
+        predictions = {}  # Lists of (course number, probability of correctness) pairs by student
 
-        student_course_matrix = self.student_course_matrix
-        courses = student_course_matrix.columns
-        enrolled_in_courses = [enrollment.course.course_number for enrollment in student.enrollments]
-        not_enrolled_in_courses = [course_number for course_number in courses
-                                   if course_number not in enrolled_in_courses]
+        cohorts = {}
+        for student in students:
+            cohorts.setdefault(student.terms_completed, []).append(student)
 
-        # Cap the requested number of recommendations by the number of courses the student is not enrolled in
-        number_recommendations = min(number_recommendations, len(not_enrolled_in_courses))
+        for terms_completed, cohort in cohorts.items():
+            with stage(instrumentation, 'generate_recommendations.score'):
+                allowed = course_ranking.candidate_mask(electives_only=electives_only,
+                                                        terms_completed=terms_completed if eligible_only else None)
 
-        Q, P = self.parameters
-        predicted_ratings = Q @ P.loc[student.student_number].T
-        predicted_ratings = predicted_ratings.loc[not_enrolled_in_courses].sort_values(ascending=False)\
-            .head(number_recommendations)
+                # The students who have registered or rated since the model was last trained have no factors to score
+                # the courses with - fall back on the most popular courses
+                known_students = []
+                for student in cohort:
+                    if course_scorer is not None and student.student_number in course_scorer.student_rows:
+                        known_students.append(student)
+                    else:
+                        enrolled_in_courses = {enrollment.course.course_number for enrollment in student.enrollments}
+                        recommended_courses = course_ranking.top(number_recommendations, exclude=enrolled_in_courses,
+                                                                 allowed=allowed)
+                        predictions[student] = list((course_ranking.courses.loc[recommended_courses, 'mean_rating']
+                                                     / 20).items())
+                if not known_students:
+                    continue
 
-        recommendations = [Recommendation(student=student, course=self.university.find_course(course_number, session),
-                                          correctness_probability=rating/20)
-                           for course_number, rating in predicted_ratings.items()]
+                scores = course_scorer.scores([course_scorer.student_rows[student.student_number]
+                                               for student in known_students])
+                scores[:, ~allowed] = -np.inf
+                enrolled_rows, enrolled_columns = [], []
+                for row, student in enumerate(known_students):
+                    for enrollment in student.enrollments:
+                        column = course_ranking.positions.get(enrollment.course.course_number)
+                        if column is not None:
+                            enrolled_rows.append(row)
+                            enrolled_columns.append(column)
+                scores[enrolled_rows, enrolled_columns] = -np.inf
 
-        return recommendations
+            # Select the top courses of each student, then sort only them
+            with stage(instrumentation, 'generate_recommendations.sort'):
+                number_top = min(number_recommendations, scores.shape[1])
+                top = np.argpartition(-scores, number_top - 1, axis=1)[:, :number_top]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind='stable')
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                top_probabilities = course_scorer.probabilities(top_scores)
+                for student, columns, scores, probabilities in zip(known_students, top, top_scores,
+                                                                   top_probabilities):
+                    predictions[student] = [(course_numbers[column], probability)
+                                            for column, score, probability in zip(columns, scores, probabilities)
+                                            if np.isfinite(score)]
+
+        with stage(instrumentation, 'generate_recommendations.course_lookup'):
+            courses = {course.course_number: course for course in self.university.courses}
+
+            def recommend(existing, create):
+                return [[existing.get((student.id, courses[course_number].id)) or
+                         create(student=student, course=courses[course_number],
+                                correctness_probability=float(probability), model_version=model_version)
+                         for course_number, probability in predictions[student]]
+                        for student in students]
+
+            def add(**values):
+                recommendation = Recommendation(**values)
+                session.add(recommendation)
+                return recommendation
+
+            # Reuse the recommendations of the same courses already generated today, instead of storing them again.
+            # The new ones are inserted together, unless a concurrent session stores some of the same recommendations
+            # first - the unique constraint then rejects the batch, and they are stored one at a time
+            existing = Recommendation.generated_on(date.today(), students, session)
+            try:
+                with session.begin_nested():
+                    recommendations = recommend(existing, add)
+            except IntegrityError:
+                existing = Recommendation.generated_on(date.today(), students, session)
+                recommendations = recommend(existing,
+                                            lambda **values: Recommendation.get_or_create(session, **values))
+            return recommendations
+
+    def similar_courses(self, course_number, k=5):
+        """Returns the courses most similar to a course, according to the trained model (i.e. the courses rated
+        similarly by the same students), read from the table of nearest courses computed by ''train_model''.
+
+        :param course_number: The course number of the course.
+        :param k: The maximum number of similar courses to return (at most the ''number_neighbours'' used in training).
+        :return: List of tuples (course number, cosine similarity), the most similar first. Empty if the model has not
+        been trained, or the course was added since.
+        """
+        course_neighbours = self.open_snapshot().course_neighbours
+        if course_neighbours is None:
+            return []
+        return course_neighbours.similar(course_number, k)
+
+
+class Snapshot:
+    """Represents a published version of the files of a :class:'RecommendationSystem'. The files of a snapshot are
+    never modified, hence they can be read without locks while newer snapshots are being published.
+
+    :param recommendation_system: :class:'RecommendationSystem' object the snapshot belongs to.
+    :param directory: Path to the directory of the snapshot.
+    """
+    METADATA_FILE = 'snapshot.json'
+    COURSE_NEIGHBOURS_FILE = 'course_neighbours.npz'
+    ENROLLMENTS_FILE = 'enrollments.csv'
+
+    def __init__(self, recommendation_system, directory):
+        self.directory = directory
+        self.version = os.path.basename(directory)
+        self.student_course_matrix_path = self.path(recommendation_system.student_course_matrix_path)
+        self.known_ratings_matrix_path = self.path(recommendation_system.known_ratings_matrix_path)
+        self.model_parameters_path_Q = self.path(recommendation_system.model_parameters_path_Q)
+        self.model_parameters_path_P = self.path(recommendation_system.model_parameters_path_P)
+        self.course_ranking_path = self.path(recommendation_system.course_ranking_path)
+
+    def path(self, name):
+        """Returns the path to the file ''name'' within the snapshot."""
+        return os.path.join(self.directory, name)
+
+    @property
+    def metadata(self):
+        with open(self.path(self.METADATA_FILE)) as f:
+            return json.load(f)
+
+    @property
+    def trained(self):
+        return os.path.exists(self.model_parameters_path_Q) and os.path.exists(self.model_parameters_path_P)
+
+    @property
+    def student_course_matrix(self):
+        import pandas as pd
+
+        try:
+            return pd.read_csv(self.student_course_matrix_path, index_col='student_number',
+                               dtype={'student_number': str})\
+                .rename_axis('course_number', axis=1)
+        except pd.errors.EmptyDataError:
+            return None
+
+    @property
+    def student_numbers(self):
+        """The student numbers indexing the rows of the student-course matrix, read without reading the matrix."""
+        import pandas as pd
+
+        try:
+            student_numbers = pd.read_csv(self.student_course_matrix_path, usecols=['student_number'],
+                                          dtype={'student_number': str})['student_number']
+        except pd.errors.EmptyDataError:
+            student_numbers = []
+        return pd.Index(student_numbers, dtype=str, name='student_number')
+
+    @property
+    def course_numbers(self):
+        """The course numbers indexing the columns of the student-course matrix, read without reading the matrix."""
+        import pandas as pd
+
+        try:
+            columns = pd.read_csv(self.student_course_matrix_path, nrows=0).columns.drop('student_number')
+        except pd.errors.EmptyDataError:
+            columns = []
+        return pd.Index(columns, dtype=str, name='course_number')
+
+    @property
+    def known_ratings_matrix(self):
+        import pandas as pd
+
+        try:
+            return pd.read_csv(self.known_ratings_matrix_path, header=None, dtype={0: str, 1: str, 2: float})
+        except pd.errors.EmptyDataError:
+            return None
+
+    @property
+    def enrollments(self):
+        import pandas as pd
+
+        path = self.path(self.ENROLLMENTS_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_csv(path, header=None, dtype={0: str, 1: str, 2: float})
+        except pd.errors.EmptyDataError:
+            return None
+
+    @property
+    def parameters(self):
+        import pandas as pd
+
+        if not self.trained:
+            return None
+        try:
+            Q = pd.read_csv(self.model_parameters_path_Q, index_col='course_number', dtype={'course_number': str})
+            P = pd.read_csv(self.model_parameters_path_P, index_col='student_number', dtype={'student_number': str})
+            return Q, P
+        except pd.errors.EmptyDataError:
+            return None
+
+    @property
+    def course_ranking(self):
+        return CourseRanking.load(self.course_ranking_path)
+
+    @property
+    def course_scorer(self):
+        if not self.trained:
+            return None
+        return CourseScorer.load(self.model_parameters_path_Q, self.model_parameters_path_P, self.course_ranking_path,
+                                 implicit=self.metadata.get('feedback') == 'implicit')
+
+    @property
+    def course_neighbours(self):
+        path = self.path(self.COURSE_NEIGHBOURS_FILE)
+        if not os.path.exists(path):
+            return None
+        return CourseNeighbours.load(path)
+
+    def __str__(self):
+        return f'Snapshot {self.version} ({self.directory})'
+
+
+class CourseRanking:
+    """Represents the rankings of the courses offered at a university by popularity and by mean rating, computed when
+    the ratings are reloaded. Used to recommend courses to students, and to score courses, missing from the trained
+    model. The orderings are computed once per loaded ranking, so retrieving the top ''k'' courses costs O(k).
+
+    Boolean masks over the courses (in the order of ''courses'') selecting the elective courses, and the courses
+    available after each number of completed terms, are precomputed as well, so that the constraints on the
+    recommended courses can be applied to whole arrays of scores.
+
+    :param courses: :class:'DataFrame' indexed by course numbers, with the columns ''semester_of_availability'',
+    ''is_elective'', ''enrollments'', ''number_ratings'', ''mean_rating'', ''popularity_rank'' and ''rating_rank''.
+    """
+    RANKINGS = {'popularity': 'popularity_rank', 'mean_rating': 'rating_rank'}
+    # Weight (in number of ratings) of the mean of all ratings, towards which the mean ratings of rarely rated courses
+    # are shrunk
+    PRIOR_WEIGHT = 5
+    # Rating assumed as the mean of all ratings when no course has been rated yet
+    DEFAULT_RATING = 5.5
+
+    CACHE_SIZE = 8  # The number of most recently loaded rankings kept in memory
+    _cache = {}  # Loaded rankings by path, along with the modification time and size of the file
+
+    def __init__(self, courses):
+        import numpy as np
+
+        self.courses = courses
+        self.positions = {course_number: position for position, course_number in enumerate(courses.index)}
+
+        # Positions of the courses in the order of each ranking, overall and within each semester
+        self._orders = {}
+        ranked = courses.assign(position=np.arange(len(courses)))
+        for ranking, rank_column in self.RANKINGS.items():
+            ordered = ranked.sort_values(rank_column)
+            self._orders[ranking, None] = ordered['position'].tolist()
+            for semester, semester_courses in ordered.groupby('semester_of_availability', sort=False):
+                self._orders[ranking, semester] = semester_courses['position'].tolist()
+
+        # Masks of the elective courses, and of the courses available after completing a number of terms (the courses
+        # available in no particular semester are always available)
+        self.elective_mask = courses['is_elective'].to_numpy(dtype=bool)
+        semesters = courses['semester_of_availability'].to_numpy(dtype=float)
+        last_semester = int(np.nanmax(semesters)) if (~np.isnan(semesters)).any() else 0
+        self._available_masks = [np.isnan(semesters) | (semesters > terms_completed)
+                                 for terms_completed in range(last_semester + 1)]
+        self._no_mask = np.ones(len(courses), dtype=bool)
+
+    @classmethod
+    def from_enrollments(cls, enrollments, courses):
+        """Computes the rankings from the enrollments of students in the courses.
+
+        :param enrollments: :class:'DataFrame' with the columns ''student_number'', ''course_number'' and ''rating''
+        (missing if the enrollment has not been rated).
+        :param courses: :class:'DataFrame' with the columns ''course_number'', ''semester_of_availability'' and
+        ''is_elective'' of all the courses offered.
+        :return: :class:'CourseRanking' object.
+        """
+        return cls._ranked(courses.set_index('course_number'), enrollments.groupby('course_number').size(),
+                           enrollments[['course_number', 'rating']].dropna())
+
+    def without(self, course_numbers=(), enrollments=None, ratings=None):
+        """Computes the rankings again after courses and enrollments have been removed, without reloading all the
+        enrollments.
+
+        :param course_numbers: Course numbers of the removed courses.
+        :param enrollments: :class:'DataFrame' with the column ''course_number'' of the removed enrollments (rated or
+        not).
+        :param ratings: :class:'DataFrame' with the columns ''course_number'' and ''rating'' of all the remaining known
+        ratings.
+        :return: :class:'CourseRanking' object.
+        """
+        import pandas as pd
+
+        courses = self.courses.drop(index=list(course_numbers), errors='ignore')
+        enrollment_counts = courses['enrollments']
+        if enrollments is not None:
+            enrollment_counts = enrollment_counts - enrollments.groupby('course_number').size()\
+                .reindex(courses.index, fill_value=0)
+        if ratings is None:
+            ratings = pd.DataFrame(columns=['course_number', 'rating'])
+        return self._ranked(courses[['semester_of_availability', 'is_elective']], enrollment_counts, ratings)
+
+    @classmethod
+    def _ranked(cls, courses, enrollment_counts, ratings):
+        """Ranks the ''courses'' (indexed by course numbers), given the number of enrollments in each course and the
+        known ratings (a :class:'DataFrame' with the columns ''course_number'' and ''rating'').
+        """
+        import numpy as np
+        import pandas as pd
+
+        statistics = ratings.groupby('course_number')['rating'].agg(['count', 'sum'])
+        courses = courses.copy()
+        courses['enrollments'] = enrollment_counts.reindex(courses.index, fill_value=0)
+        courses['number_ratings'] = statistics['count'].reindex(courses.index, fill_value=0)
+
+        # Shrink the mean rating of each course towards the mean of all ratings, so that a single high rating does not
+        # outrank many consistently good ones
+        mean = ratings['rating'].astype(float).mean() if courses['number_ratings'].any() else cls.DEFAULT_RATING
+        rating_sums = statistics['sum'].reindex(courses.index, fill_value=0)
+        courses['mean_rating'] = (rating_sums + cls.PRIOR_WEIGHT * mean) / \
+            (courses['number_ratings'] + cls.PRIOR_WEIGHT)
+
+        # Rank the courses (starting with 1), breaking the ties of one ranking with the other one
+        for rank_column, order in (('popularity_rank', ['enrollments', 'mean_rating']),
+                                   ('rating_rank', ['mean_rating', 'enrollments'])):
+            ordered = courses.sort_values(order, ascending=False, kind='stable').index
+            courses[rank_column] = pd.Series(np.arange(1, len(ordered) + 1), index=ordered)
+        return cls(courses.sort_values('popularity_rank'))
+
+    @classmethod
+    def load(cls, path):
+        """Reads the rankings from a .csv file, reusing the previously loaded rankings if the file has not changed.
+
+        :param path: Path to the .csv file written by ''save''.
+        :return: :class:'CourseRanking' object, or ''None'' if the file is empty.
+        """
+        import pandas as pd
+
+        status = os.stat(path)
+        stamp = (status.st_mtime_ns, status.st_size)
+        cached = cls._cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            courses = pd.read_csv(path, index_col='course_number', dtype={'course_number': str})
+        except pd.errors.EmptyDataError:
+            return None
+        ranking = cls(courses)
+        cls._cache[path] = (stamp, ranking)
+        while len(cls._cache) > cls.CACHE_SIZE:
+            cls._cache.pop(next(iter(cls._cache)))
+        return ranking
+
+    def save(self, path):
+        """Writes the rankings to a .csv file.
+
+        :param path: Path to the .csv file.
+        """
+        self.courses.to_csv(path, index=True)
+
+    def candidate_mask(self, electives_only=True, terms_completed=None):
+        """Returns the mask of the courses which may be recommended, in the order of ''courses''.
+
+        :param electives_only: Whether to only allow elective courses.
+        :param terms_completed: If given, only the courses available in a semester after this number of completed terms
+        are allowed.
+        :return: Boolean :class:'numpy.ndarray'.
+        """
+        mask = self.elective_mask if electives_only else self._no_mask
+        if terms_completed is not None:
+            # After the last semester only the courses available in no particular semester remain
+            mask = mask & self._available_masks[min(max(terms_completed, 0), len(self._available_masks) - 1)]
+        return mask
+
+    def top(self, number, ranking='popularity', semester=None, exclude=(), allowed=None):
+        """Returns the course numbers of the top ranked courses.
+
+        :param number: The maximum number of courses to return.
+        :param ranking: Either ''popularity'' (the number of enrollments) or ''mean_rating''.
+        :param semester: If given, only the courses available in this semester are ranked.
+        :param exclude: Course numbers of the courses to skip (e.g. the ones the student is enrolled in).
+        :param allowed: If given, a mask (as returned by ''candidate_mask'') of the courses which may be returned.
+        :return: List of course numbers, best ranked first.
+        """
+        assert ranking in self.RANKINGS, f'The ranking must be one of {list(self.RANKINGS)}'
+        course_numbers = self.courses.index
+        top = []
+        for position in self._orders.get((ranking, semester), []):
+            if len(top) == number:
+                break
+            if (allowed is None or allowed[position]) and course_numbers[position] not in exclude:
+                top.append(course_numbers[position])
+        return top
+
+
+class CourseScorer:
+    """Represents the factors of a trained model, aligned with the courses of a :class:'CourseRanking', used to score
+    all the courses for many students with a single matrix product. The courses added since the model was trained are
+    scored by their mean rating (or as not preferred, if the model was trained on implicit feedback).
+
+    :param Q: Course factor :class:'DataFrame', indexed by course numbers.
+    :param P: Student factor :class:'DataFrame', indexed by student numbers.
+    :param course_ranking: :class:'CourseRanking' of the courses currently offered.
+    :param implicit: Whether the model was trained on implicit feedback, i.e. scores courses by predicted preferences
+    instead of predicted ratings.
+    """
+    CACHE_SIZE = 8  # The number of most recently loaded scorers kept in memory
+    _cache = {}  # Loaded scorers by paths, along with the modification times and sizes of the files
+
+    def __init__(self, Q, P, course_ranking, implicit=False):
+        import numpy as np
+
+        self.course_ranking = course_ranking
+        self.implicit = implicit
+        self.student_rows = {student_number: row for row, student_number in enumerate(P.index)}
+        # Factors read from files without rows (e.g. trained before any ratings) are not inferred to be numbers
+        self.P = P.to_numpy(dtype=float)
+        self.Q = Q.reindex(course_ranking.courses.index).to_numpy(dtype=float)
+        self.new_courses = np.isnan(self.Q).any(axis=1)
+        self.Q[self.new_courses] = 0
+        if implicit:
+            self.new_course_ratings = 0.0  # No preference
+        else:
+            self.new_course_ratings = course_ranking.courses['mean_rating'].to_numpy()[self.new_courses]
+
+    @classmethod
+    def load(cls, path_Q, path_P, course_ranking_path, implicit=False):
+        """Reads the factors from .csv files, reusing the previously loaded scorer if none of the files has changed.
+
+        :param path_Q: Path to the .csv file containing the course factors.
+        :param path_P: Path to the .csv file containing the student factors.
+        :param course_ranking_path: Path to the .csv file containing the :class:'CourseRanking'.
+        :param implicit: Whether the model was trained on implicit feedback.
+        :return: :class:'CourseScorer' object, or ''None'' if any of the files is empty.
+        """
+        import pandas as pd
+
+        paths = (path_Q, path_P, course_ranking_path)
+        stamp = tuple((status.st_mtime_ns, status.st_size) for status in map(os.stat, paths))
+        cached = cls._cache.get((paths, implicit))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        course_ranking = CourseRanking.load(course_ranking_path)
+        try:
+            Q = pd.read_csv(path_Q, index_col='course_number', dtype={'course_number': str})
+            P = pd.read_csv(path_P, index_col='student_number', dtype={'student_number': str})
+        except pd.errors.EmptyDataError:
+            return None
+        if course_ranking is None:
+            return None
+        scorer = cls(Q, P, course_ranking, implicit=implicit)
+        cls._cache[paths, implicit] = (stamp, scorer)
+        while len(cls._cache) > cls.CACHE_SIZE:
+            cls._cache.pop(next(iter(cls._cache)))
+        return scorer
+
+    def scores(self, student_rows):
+        """Predicts the ratings of all the courses (in the order of the :class:'CourseRanking') for the students in the
+        given rows of P.
+
+        :param student_rows: List of row positions in P.
+        :return: :class:'numpy.ndarray' of shape (|students|, |courses|).
+        """
+        scores = self.P[student_rows] @ self.Q.T
+        scores[:, self.new_courses] = self.new_course_ratings
+        return scores
+
+    def probabilities(self, scores):
+        """Converts scores returned by ''scores'' to probabilities of correctness of the recommendations.
+
+        :param scores: :class:'numpy.ndarray' of scores.
+        :return: :class:'numpy.ndarray' of the same shape, with values in [0, 1].
+        """
+        import numpy as np
+
+        if self.implicit:
+            return np.clip(scores, 0, 1)
+        return scores / 20
+
+
+class CourseNeighbours:
+    """Represents the table of the most similar courses to each course, by the cosine similarity of their factors in a
+    trained model. The table holds the positions of the ''N'' nearest courses of each course, best first, so that
+    looking up the ''k'' most similar courses costs O(k). Rows with fewer than ''N'' neighbours are padded with -1.
+
+    :param course_numbers: Array of the course numbers, in the order of the rows of the table.
+    :param neighbours: Integer array of shape (|courses|, N), the positions of the nearest courses.
+    :param similarities: Array of shape (|courses|, N), the similarities of the nearest courses.
+    """
+    CACHE_SIZE = 8  # The number of most recently loaded tables kept in memory
+    _cache = {}  # Loaded tables by path, along with the modification time and size of the file
+
+    def __init__(self, course_numbers, neighbours, similarities):
+        self.course_numbers = course_numbers
+        self.neighbours = neighbours
+        self.similarities = similarities
+        self.positions = {course_number: position for position, course_number in enumerate(course_numbers)}
+
+    @classmethod
+    def from_factors(cls, Q, course_numbers, number_neighbours=10, block_size=1024):
+        """Computes the table from the course factors. The similarities are computed for blocks of ''block_size''
+        courses at a time, and only the nearest courses of each block are kept (found by partial sorting), so the
+        memory used is bounded by ''block_size'' x |courses| regardless of the size of the catalogue.
+
+        :param Q: Course factor matrix (|courses| x factors).
+        :param course_numbers: The course numbers of the rows of Q.
+        :param number_neighbours: The number of nearest courses kept for each course.
+        :param block_size: The number of courses compared with all the others at a time.
+        :return: :class:'CourseNeighbours' object.
+        """
+        import numpy as np
+
+        number_courses = Q.shape[0]
+        number_neighbours = max(min(number_neighbours, number_courses - 1), 0)
+        norms = np.linalg.norm(Q, axis=1, keepdims=True)
+        normalized = (Q / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+        neighbours = np.empty((number_courses, number_neighbours), dtype=np.int32)
+        similarities = np.empty((number_courses, number_neighbours), dtype=np.float32)
+        for start in range(0, number_courses if number_neighbours else 0, block_size):
+            stop = min(start + block_size, number_courses)
+            block_similarities = normalized[start:stop] @ normalized.T
+            # A course is not its own neighbour
+            block_similarities[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+            nearest = np.argpartition(-block_similarities, number_neighbours - 1, axis=1)[:, :number_neighbours]
+            nearest_similarities = np.take_along_axis(block_similarities, nearest, axis=1)
+            order = np.argsort(-nearest_similarities, axis=1, kind='stable')
+            neighbours[start:stop] = np.take_along_axis(nearest, order, axis=1)
+            similarities[start:stop] = np.take_along_axis(nearest_similarities, order, axis=1)
+        return cls(np.asarray(course_numbers, dtype=str), neighbours, similarities)
+
+    @classmethod
+    def load(cls, path):
+        """Reads the table from a .npz file, reusing the previously loaded table if the file has not changed.
+
+        :param path: Path to the .npz file written by ''save''.
+        :return: :class:'CourseNeighbours' object.
+        """
+        import numpy as np
+
+        status = os.stat(path)
+        stamp = (status.st_mtime_ns, status.st_size)
+        cached = cls._cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with np.load(path, allow_pickle=False) as arrays:
+            table = cls(arrays['course_numbers'], arrays['neighbours'], arrays['similarities'])
+        cls._cache[path] = (stamp, table)
+        while len(cls._cache) > cls.CACHE_SIZE:
+            cls._cache.pop(next(iter(cls._cache)))
+        return table
+
+    def save(self, path):
+        """Writes the table to an uncompressed .npz file (32 bit positions and similarities).
+
+        :param path: Path to the .npz file.
+        """
+        import numpy as np
+
+        with open(path, 'wb') as f:
+            np.savez(f, course_numbers=self.course_numbers, neighbours=self.neighbours, similarities=self.similarities)
+
+    def similar(self, course_number, k):
+        """Returns the ''k'' courses most similar to a course.
+
+        :param course_number: The course number of the course.
+        :param k: The maximum number of similar courses to return (no more than the ''N'' stored are returned).
+        :return: List of tuples (course number, similarity), the most similar first. Empty if the course is not in the
+        table.
+        """
+        position = self.positions.get(course_number)
+        if position is None:
+            return []
+        return [(str(self.course_numbers[neighbour]), float(similarity))
+                for neighbour, similarity in zip(self.neighbours[position, :k], self.similarities[position, :k])
+                if neighbour >= 0]
+
+    def without(self, course_numbers):
+        """Returns the table without the given courses, neither as rows nor as neighbours. The remaining neighbours of
+        each course keep their order, and the rows are padded with -1 where a removed neighbour was.
+
+        :param course_numbers: Course numbers of the removed courses.
+        :return: :class:'CourseNeighbours' object.
+        """
+        import numpy as np
+
+        kept = ~np.isin(self.course_numbers, list(course_numbers))
+        new_positions = np.where(kept, np.cumsum(kept) - 1, -1).astype(np.int32)
+
+        neighbours = np.where(self.neighbours >= 0, new_positions[self.neighbours], -1)[kept]
+        similarities = self.similarities[kept]
+        # Move the removed neighbours to the end of each row, keeping the order of the others
+        order = np.argsort(neighbours < 0, axis=1, kind='stable')
+        neighbours = np.take_along_axis(neighbours, order, axis=1).astype(np.int32)
+        similarities = np.take_along_axis(similarities, order, axis=1)
+        similarities[neighbours < 0] = np.nan
+        return CourseNeighbours(self.course_numbers[kept], neighbours, similarities)
+
+
+class Checkpoint:
+    """Represents the state of a training run after an epoch, from which the run can be continued.
+
+    :param Q: Course factor matrix.
+    :param P: Student factor matrix.
+    :param errors: The training errors of the epochs run so far.
+    :param epoch: The number of the last completed epoch (starting with 0).
+    :param random_state: The state of the random number generator (''numpy.random.Generator.bit_generator.state'').
+    :param hyperparameters: Dictionary of the hyperparameters of the run.
+    :param snapshot_version: The version of the :class:'Snapshot' whose ratings the model is trained on.
+    """
+
+    def __init__(self, *, Q, P, errors, epoch, random_state, hyperparameters, snapshot_version):
+        self.Q = Q
+        self.P = P
+        self.errors = errors
+        self.epoch = epoch
+        self.random_state = random_state
+        self.hyperparameters = hyperparameters
+        self.snapshot_version = snapshot_version
+
+    @classmethod
+    def load(cls, path):
+        """Reads a checkpoint written by ''save''.
+
+        :param path: Path to the .npz file.
+        :return: :class:'Checkpoint' object, or ''None'' if there is no checkpoint.
+        """
+        import numpy as np
+
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                return cls(Q=arrays['Q'], P=arrays['P'], errors=arrays['errors'].tolist(), epoch=int(arrays['epoch']),
+                           random_state=json.loads(str(arrays['random_state'])),
+                           hyperparameters=json.loads(str(arrays['hyperparameters'])),
+                           snapshot_version=str(arrays['snapshot_version']))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path):
+        """Atomically writes the checkpoint to an uncompressed .npz file: the arrays are written to a temporary file
+        which then replaces the previous checkpoint, so that an interrupted write never leaves a corrupt checkpoint.
+
+        :param path: Path to the .npz file.
+        """
+        import numpy as np
+
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident() % 10000:04d}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, Q=self.Q, P=self.P, errors=np.asarray(self.errors, dtype=float), epoch=self.epoch,
+                     random_state=json.dumps(self.random_state), hyperparameters=json.dumps(self.hyperparameters),
+                     snapshot_version=self.snapshot_version)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def snapshot_version_of(path):
+        """Returns the version of the snapshot the checkpoint at ''path'' was trained on, without reading its factors.
+
+        :param path: Path to the .npz file.
+        :return: The version of the snapshot, or ''None'' if there is no checkpoint.
+        """
+        if not os.path.exists(path):
+            return None
+        import numpy as np
+
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                return str(arrays['snapshot_version'])
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def remove(path):
+        """Removes the checkpoint at ''path'', if there is one."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def restore(self, random_state):
+        """Returns copies of the factors and the errors, and the first epoch to run, and restores the state of the
+        ''random_state'' generator.
+
+        :param random_state: :class:'numpy.random.Generator' object.
+        :return: A tuple (Q, P, errors, next epoch).
+        """
+        random_state.bit_generator.state = self.random_state
+        return self.Q.copy(), self.P.copy(), list(self.errors), self.epoch + 1
+
+
+def _fingerprint(*values):
+    """Returns a hexadecimal digest of the JSON serializable ''values''."""
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def index_ratings(known_ratings_matrix, student_numbers, course_numbers):
+    """Converts the known ratings (student number, course number, rating triples) into arrays of positions within
+    ''student_numbers'' and ''course_numbers'', as used by :func:'factorize'.
+
+    :param known_ratings_matrix: :class:'DataFrame' of known ratings, as returned by
+    :class:'RecommendationSystem'.''known_ratings_matrix'' (or ''None'' if there are no ratings).
+    :param student_numbers: The student numbers indexing the rows of the student factor matrix.
+    :param course_numbers: The course numbers indexing the rows of the course factor matrix.
+    :return: A tuple of arrays (student indices, course indices, ratings).
+    """
+    import numpy as np
+    import pandas as pd
+
+    if known_ratings_matrix is None:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    student_indices = pd.Index(student_numbers).get_indexer(known_ratings_matrix.iloc[:, 0])
+    course_indices = pd.Index(course_numbers).get_indexer(known_ratings_matrix.iloc[:, 1])
+    assert (student_indices >= 0).all() and (course_indices >= 0).all(), \
+        'Known ratings refer to students or courses missing from the student-course matrix'
+    return student_indices, course_indices, known_ratings_matrix.iloc[:, 2].to_numpy(dtype=float)
+
+
+def factorize(student_indices, course_indices, ratings, *, number_students, number_courses,
+              regularization_parameter=0.1, epochs=40, learning_rate=0.015, number_factors=20, loss='mse',
+              random_state=None, epoch_callback=None, resume_from=None, checkpoint_callback=None,
+              instrumentation=None):
+    """Factorizes the ratings matrix into a course factor matrix Q and a student factor matrix P using stochastic
+    gradient descent, by minimizing the L2 regularized ''loss'' (the sum of squares error by default) of known ratings
+    reconstruction. The SGD updates are applied in the order in which the ratings are given.
+
+    :param student_indices: Array of row positions in P of the rated students.
+    :param course_indices: Array of row positions in Q of the rated courses.
+    :param ratings: Array of the known ratings.
+    :param number_students: Number of rows of P.
+    :param number_courses: Number of rows of Q.
+    :param regularization_parameter: L2 regularization coefficient.
+    :param epochs: Number of epochs (iterations) to run SGD for.
+    :param learning_rate: SGD learning rate parameter.
+    :param number_factors: The number of factors used for ratings matrix factorization.
+    :param loss: The name of a loss function registered in :mod:'losses', or a :class:'losses.Loss' object.
+    :param random_state: Seed or :class:'numpy.random.Generator' used to initialize the factors.
+    :param epoch_callback: A callable invoked after each epoch as ''epoch_callback(epoch, Q, P, error)''. If it
+    returns a true value, training stops early.
+    :param resume_from: :class:'Checkpoint' object of an interrupted run to continue, instead of starting from random
+    factors.
+    :param checkpoint_callback: A callable invoked after each epoch as ''checkpoint_callback(epoch, Q, P, errors,
+    random_state)'', e.g. to save a :class:'Checkpoint'.
+    :param instrumentation: :class:'Instrumentation' object recording the timings of the SGD and loss passes, and the
+    statistics of each epoch.
+    :return: A tuple (Q, P, errors), where ''errors'' is the list of training errors on each epoch.
+    """
+    import numpy as np
+
+    random_state = np.random.default_rng(random_state)
+
+    if resume_from is not None:
+        Q, P, errors, start_epoch = resume_from.restore(random_state)
+    else:
+        # Initialize the decomposition matrices to random values in [ 0, sqrt(10/nr_factors) )
+        init_high = np.sqrt(10 / number_factors)
+        Q = random_state.uniform(low=0.0, high=init_high, size=(number_courses, number_factors))
+        P = random_state.uniform(low=0.0, high=init_high, size=(number_students, number_factors))
+        errors, start_epoch = [], 0  # Errors on each iteration
+
+    loss = get_loss(loss)
+    weights = loss.weights(ratings)
+    examples = list(zip(student_indices.tolist(), course_indices.tolist(), ratings.tolist(), weights.tolist()))
+    for epoch in range(start_epoch, epochs):
+        # -- Compute and apply SGD updates for each training example --
+        with stage(instrumentation, 'train_model.sgd') as sgd_timer:
+            _sgd_pass(Q, P, examples, learning_rate, regularization_parameter, loss)
+
+        # -- Compute the training set error on the current iteration --
+        with stage(instrumentation, 'train_model.loss') as loss_timer:
+            residuals = ratings - np.einsum('ij,ij->i', Q[course_indices], P[student_indices])
+            error = np.sum(loss.value(residuals, weights)) + \
+                regularization_parameter * (np.sum(Q ** 2) + np.sum(P ** 2))
+        errors.append(error)
+
+        if instrumentation is not None:
+            instrumentation.record_epoch(epoch=epoch, loss=error, sgd_seconds=sgd_timer.elapsed,
+                                         loss_seconds=loss_timer.elapsed, updates=len(examples))
+        if checkpoint_callback is not None:
+            checkpoint_callback(epoch, Q, P, errors, random_state)
+        if epoch_callback is not None and epoch_callback(epoch, Q, P, error):
+            break
+
+    return Q, P, errors
+
+
+def _write_factors(path, factors, index, rows_per_chunk=10000):
+    """Writes a factor matrix to a .csv file with its rows labelled by ''index'', ''rows_per_chunk'' rows at a time
+    (so that memory mapped factors are never loaded at once).
+    """
+    import pandas as pd
+
+    with open(path, 'w', newline='') as f:
+        for start in range(0, max(len(factors), 1), rows_per_chunk):
+            pd.DataFrame(factors[start:start + rows_per_chunk], index=index[start:start + rows_per_chunk])\
+                .to_csv(f, header=start == 0)
+
+
+def _sgd_pass(Q, P, examples, learning_rate, regularization_parameter, loss):
+    """Applies the SGD updates of the ''examples'' (student index, course index, rating, weight tuples) to Q and P in
+    place, in the order given, minimizing the :class:'losses.Loss' ''loss''. The gradient of the built-in losses is
+    computed inline with scalar arithmetic, so that they all cost the same as the squared error.
+    """
+    clip, gradient = loss.clip, loss.custom_gradient
+    for student_index, course_index, rating, weight in examples:
+        # Rows corresponding to the current student-course pair (views into the decomposition matrices)
+        q = Q[course_index]
+        p = P[student_index]
+
+        # Compute a common error term
+        residual = rating - q @ p
+        if clip is not None:
+            residual = max(-clip, min(clip, residual))
+        epsilon = 2 * weight * residual if gradient is None else gradient(residual, weight)
+
+        # Compute SGD updates, then apply them to both rows
+        q_update = learning_rate * ((epsilon * p) - (2 * regularization_parameter * q))
+        p_update = learning_rate * ((epsilon * q) - (2 * regularization_parameter * p))
+        q += q_update
+        p += p_update
+
+
+def streaming_block_size(memory_budget, number_factors):
+    """Returns the number of ratings processed at a time by :func:'factorize_streaming' within a memory budget. Each
+    rating of a block needs its binary record, its position in the shuffled order, the Python objects of its SGD
+    example, and at most one row of Q and one of P.
+
+    :param memory_budget: The approximate number of bytes the block may use.
+    :param number_factors: The number of factors of the model.
+    :return: The number of ratings per block (at least 1).
+    """
+    bytes_per_rating = 12 + 8 + 200 + 2 * 8 * number_factors
+    return max(1, int(memory_budget // bytes_per_rating))
+
+
+def write_rating_shards(known_ratings_path, directory, student_numbers, course_numbers, shard_size):
+    """Converts a known ratings .csv file (as stored in a :class:'Snapshot') into binary shards which can be memory
+    mapped, each a .npy file of up to ''shard_size'' records of the student index (int32), the course index (int32)
+    and the rating (float32). The .csv file is read ''shard_size'' lines at a time, and the shards are written to a
+    staging directory which is renamed to ''directory'' once complete.
+
+    :param known_ratings_path: Path to the known ratings .csv file.
+    :param directory: Path to the directory to write the shards to. If it exists, the shards in it are reused.
+    :param student_numbers: The student numbers indexing the rows of the student factor matrix.
+    :param course_numbers: The course numbers indexing the rows of the course factor matrix.
+    :param shard_size: The maximum number of ratings per shard.
+    :return: List of the paths to the shards, in order.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not os.path.isdir(directory):
+        staging_directory = f'{directory}.{os.getpid()}.{threading.get_ident() % 10000:04d}.tmp'
+        os.makedirs(staging_directory)
+        student_numbers, course_numbers = pd.Index(student_numbers), pd.Index(course_numbers)
+        try:
+            chunks = pd.read_csv(known_ratings_path, header=None, dtype={0: str, 1: str, 2: float},
+                                 chunksize=shard_size)
+            for number, chunk in enumerate(chunks):
+                shard = np.empty(len(chunk), dtype=RATING_SHARD_FIELDS)
+                shard['student'] = student_numbers.get_indexer(chunk[0])
+                shard['course'] = course_numbers.get_indexer(chunk[1])
+                shard['rating'] = chunk[2].to_numpy()
+                assert (shard['student'] >= 0).all() and (shard['course'] >= 0).all(), \
+                    'Known ratings refer to students or courses missing from the student-course matrix'
+                np.save(os.path.join(staging_directory, f'shard_{number:05d}.npy'), shard)
+        except pd.errors.EmptyDataError:
+            pass
+        try:
+            os.rename(staging_directory, directory)
+        except OSError:  # Written by another process in the meantime
+            shutil.rmtree(staging_directory, ignore_errors=True)
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+
+def factorize_streaming(shard_paths, *, number_students, number_courses, work_directory,
+                        regularization_parameter=0.1, epochs=40, learning_rate=0.015, number_factors=20, loss='mse',
+                        memory_budget=256 * 2 ** 20, random_state=None, epoch_callback=None, instrumentation=None):
+    """Factorizes the ratings matrix like :func:'factorize', without loading the ratings or the factors into memory.
+    The ratings are read from memory mapped shards (see :func:'write_rating_shards') in blocks, in a random order of
+    the blocks and of the ratings within each block on every epoch. Q and P are memory mapped .npy files in
+    ''work_directory'', and only the rows touched by the current block are copied into memory, updated and written
+    back. The size of the blocks is set by ''memory_budget'' (see :func:'streaming_block_size'), not by the number of
+    ratings.
+
+    :param shard_paths: Paths to the .npy shards of ratings.
+    :param number_students: Number of rows of P.
+    :param number_courses: Number of rows of Q.
+    :param work_directory: Path to the directory to store Q and P in (as ''Q.npy'' and ''P.npy'').
+    :param regularization_parameter: L2 regularization coefficient.
+    :param epochs: Number of epochs (iterations) to run SGD for.
+    :param learning_rate: SGD learning rate parameter.
+    :param number_factors: The number of factors used for ratings matrix factorization.
+    :param loss: The name of a loss function registered in :mod:'losses', or a :class:'losses.Loss' object.
+    :param memory_budget: The approximate number of bytes used by a block of ratings and the factors it touches.
+    :param random_state: Seed or :class:'numpy.random.Generator' used to initialize the factors and shuffle the ratings.
+    :param epoch_callback: A callable invoked after each epoch as ''epoch_callback(epoch, Q, P, error)''. If it
+    returns a true value, training stops early.
+    :param instrumentation: :class:'Instrumentation' object recording the timings of the SGD and loss passes, and the
+    statistics of each epoch.
+    :return: A tuple (Q, P, errors), where Q and P are :class:'numpy.memmap' objects and ''errors'' is the list of
+    training errors on each epoch.
+    """
+    import numpy as np
+
+    random_state = np.random.default_rng(random_state)
+    loss = get_loss(loss)
+    block_size = streaming_block_size(memory_budget, number_factors)
+    os.makedirs(work_directory, exist_ok=True)
+
+    # Initialize the decomposition matrices to random values in [ 0, sqrt(10/nr_factors) ), a block of rows at a time
+    init_high = np.sqrt(10 / number_factors)
+    Q = np.lib.format.open_memmap(os.path.join(work_directory, 'Q.npy'), mode='w+', dtype=float,
+                                  shape=(number_courses, number_factors))
+    P = np.lib.format.open_memmap(os.path.join(work_directory, 'P.npy'), mode='w+', dtype=float,
+                                  shape=(number_students, number_factors))
+    for factors in (Q, P):
+        for start in range(0, len(factors), block_size):
+            stop = min(start + block_size, len(factors))
+            factors[start:stop] = random_state.uniform(low=0.0, high=init_high, size=(stop - start, number_factors))
+
+    shards = [np.load(path, mmap_mode='r') for path in shard_paths]
+    blocks = [(shard, start) for shard in shards for start in range(0, len(shard), block_size)]
+    number_ratings = sum(len(shard) for shard in shards)
+
+    def read_block(shard, start):
+        block = np.array(shard[start:start + block_size])
+        students, student_rows = np.unique(block['student'], return_inverse=True)
+        courses, course_rows = np.unique(block['course'], return_inverse=True)
+        return block, students, student_rows, courses, course_rows
+
+    errors = []
+    for epoch in range(epochs):
+        # -- Compute and apply SGD updates for each training example, a shuffled block at a time --
+        with stage(instrumentation, 'train_model.sgd') as sgd_timer:
+            for position in random_state.permutation(len(blocks)):
+                block, students, student_rows, courses, course_rows = read_block(*blocks[position])
+                order = random_state.permutation(len(block))
+                block_Q, block_P = Q[courses], P[students]
+                ratings = block['rating'][order].astype(float)
+                _sgd_pass(block_Q, block_P, list(zip(student_rows[order].tolist(), course_rows[order].tolist(),
+                                                     ratings.tolist(), loss.weights(ratings).tolist())),
+                          learning_rate, regularization_parameter, loss)
+                Q[courses], P[students] = block_Q, block_P
+
+        # -- Compute the training set error on the current iteration, a block at a time --
+        with stage(instrumentation, 'train_model.loss') as loss_timer:
+            error = 0.0
+            for shard, start in blocks:
+                block, students, student_rows, courses, course_rows = read_block(shard, start)
+                ratings = block['rating'].astype(float)
+                residuals = ratings - np.einsum('ij,ij->i', Q[courses][course_rows], P[students][student_rows])
+                error += np.sum(loss.value(residuals, loss.weights(ratings)))
+            for factors in (Q, P):
+                for start in range(0, len(factors), block_size):
+                    error += regularization_parameter * np.sum(factors[start:start + block_size] ** 2)
+        errors.append(error)
+
+        if instrumentation is not None:
+            instrumentation.record_epoch(epoch=epoch, loss=error, sgd_seconds=sgd_timer.elapsed,
+                                         loss_seconds=loss_timer.elapsed, updates=number_ratings)
+        if epoch_callback is not None and epoch_callback(epoch, Q, P, error):
+            break
+
+    Q.flush()
+    P.flush()
+    return Q, P, errors
+
+
+def factorize_implicit(student_indices, course_indices, confidences, *, number_students, number_courses,
+                       regularization_parameter=0.1, epochs=15, number_factors=20, cg_steps=3, random_state=None,
+                       epoch_callback=None, resume_from=None, checkpoint_callback=None, instrumentation=None):
+    """Factorizes the implicit preferences of students for courses into a course factor matrix Q and a student factor
+    matrix P using weighted alternating least squares. Every observed (student, course) pair is a preference of 1 with
+    the given confidence, and all the other pairs are preferences of 0 with a confidence of 1. Each epoch updates P
+    with Q fixed, then Q with P fixed, taking ''cg_steps'' steps of the conjugate gradient method towards the least
+    squares solution of every row.
+
+    The dense |students| x |courses| preference matrix is never built: the contribution of the unobserved pairs is
+    computed once per half-epoch from the Gram matrix of the fixed factors (''Q.T @ Q'' or ''P.T @ P''), so the cost of
+    an epoch is O(|observations| x factors + (|students| + |courses|) x factors^2).
+
+    :param student_indices: Array of row positions in P of the students of the observations.
+    :param course_indices: Array of row positions in Q of the courses of the observations.
+    :param confidences: Array of the confidences (greater than or equal to 1) of the observations.
+    :param number_students: Number of rows of P.
+    :param number_courses: Number of rows of Q.
+    :param regularization_parameter: L2 regularization coefficient.
+    :param epochs: Number of epochs (alternations) to run.
+    :param number_factors: The number of factors used for the factorization.
+    :param cg_steps: The number of conjugate gradient steps per row and half-epoch.
+    :param random_state: Seed or :class:'numpy.random.Generator' used to initialize the factors.
+    :param epoch_callback: A callable invoked after each epoch as ''epoch_callback(epoch, Q, P, error)''. If it
+    returns a true value, training stops early.
+    :param resume_from: :class:'Checkpoint' object of an interrupted run to continue, instead of starting from random
+    factors.
+    :param checkpoint_callback: A callable invoked after each epoch as ''checkpoint_callback(epoch, Q, P, errors,
+    random_state)'', e.g. to save a :class:'Checkpoint'.
+    :param instrumentation: :class:'Instrumentation' object recording the timings of the least squares and loss passes,
+    and the statistics of each epoch.
+    :return: A tuple (Q, P, errors), where ''errors'' is the list of the weighted training losses on each epoch.
+    """
+    import numpy as np
+
+    random_state = np.random.default_rng(random_state)
+    if resume_from is not None:
+        Q, P, errors, start_epoch = resume_from.restore(random_state)
+    else:
+        Q = random_state.uniform(low=0.0, high=0.01, size=(number_courses, number_factors))
+        P = random_state.uniform(low=0.0, high=0.01, size=(number_students, number_factors))
+        errors, start_epoch = [], 0
+
+    # The observations ordered by student (to update P) and by course (to update Q)
+    by_student = np.argsort(student_indices, kind='stable')
+    by_course = np.argsort(course_indices, kind='stable')
+
+    for epoch in range(start_epoch, epochs):
+        with stage(instrumentation, 'train_model.als') as als_timer:
+            _conjugate_gradient_rows(P, Q, student_indices[by_student], course_indices[by_student],
+                                     confidences[by_student], regularization_parameter, cg_steps)
+            _conjugate_gradient_rows(Q, P, course_indices[by_course], student_indices[by_course],
+                                     confidences[by_course], regularization_parameter, cg_steps)
+
+        # -- Compute the weighted loss over all the pairs, of which the unobserved ones contribute the squared norm of
+        # Q @ P.T (computed from the Gram matrices) --
+        with stage(instrumentation, 'train_model.loss') as loss_timer:
+            predictions = np.einsum('ij,ij->i', Q[course_indices], P[student_indices])
+            error = np.sum((Q.T @ Q) * (P.T @ P)) + np.sum(confidences * (1 - predictions) ** 2 - predictions ** 2) + \
+                regularization_parameter * (np.sum(Q ** 2) + np.sum(P ** 2))
+        errors.append(error)
+
+        if instrumentation is not None:
+            instrumentation.record_epoch(epoch=epoch, loss=error, sgd_seconds=als_timer.elapsed,
+                                         loss_seconds=loss_timer.elapsed, updates=number_students + number_courses)
+        if checkpoint_callback is not None:
+            checkpoint_callback(epoch, Q, P, errors, random_state)
+        if epoch_callback is not None and epoch_callback(epoch, Q, P, error):
+            break
+
+    return Q, P, errors
+
+
+def _conjugate_gradient_rows(X, Y, rows, columns, confidences, regularization_parameter, steps):
+    """Updates every row x of X in place by ''steps'' of the conjugate gradient method, started from its current value,
+    towards the solution of (Y.T @ C @ Y + regularization * I) x = Y.T @ C @ p, where C holds the confidences of the
+    row's observations (1 elsewhere) and p is 1 for the observed columns (0 elsewhere). All the rows are solved at once.
+    The observations (''rows'', ''columns'', ''confidences'') must be sorted by row.
+    """
+    import numpy as np
+
+    gram = Y.T @ Y + regularization_parameter * np.eye(Y.shape[1])
+    observed = Y[columns]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.intp)
+
+    def sum_by_row(values):
+        sums = np.zeros_like(X)
+        if len(starts):
+            sums[rows[starts]] = np.add.reduceat(values, starts, axis=0)
+        return sums
+
+    def multiply(V):
+        # (Y.T @ C @ Y + regularization * I) @ v for every row v of V, with C - I nonzero only at the observations
+        weights = (confidences - 1) * np.einsum('ij,ij->i', observed, V[rows])
+        return V @ gram + sum_by_row(weights[:, None] * observed)
+
+    residuals = sum_by_row(confidences[:, None] * observed) - multiply(X)
+    directions = residuals.copy()
+    residual_norms = np.einsum('ij,ij->i', residuals, residuals)
+    for _ in range(steps):
+        products = multiply(directions)
+        curvatures = np.einsum('ij,ij->i', directions, products)
+        step_sizes = np.divide(residual_norms, curvatures, out=np.zeros_like(curvatures), where=curvatures > 0)
+        X += step_sizes[:, None] * directions
+        residuals -= step_sizes[:, None] * products
+        new_residual_norms = np.einsum('ij,ij->i', residuals, residuals)
+        betas = np.divide(new_residual_norms, residual_norms, out=np.zeros_like(residual_norms),
+                          where=residual_norms > 0)
+        directions = residuals + betas[:, None] * directions
+        residual_norms = new_residual_norms
 
 
 class Recommendation(Base):
@@ -239,12 +1766,15 @@ class Recommendation(Base):
     :param student: :class:'Student' who adds this recommendation.
     :param course: :class:'Course' object which is recommended.
     :param correctness_probability: Probability of correctness of the recommendation (value in [0, 1]).
+    :param date_generated: Date the recommendation was generated on (default: today).
+    :param model_version: Version of the :class:'RecommendationSystem' model which generated the recommendation.
     """
     __tablename__ = 'recommendation'
 
     id = Column(Integer, primary_key=True)
     correctness_probability = Column(Float(2))
     date_generated = Column(Date)
+    model_version = Column(Integer)
     course_id = Column(Integer, ForeignKey('course.id'))
     student_id = Column(Integer, ForeignKey('student.id'))
 
@@ -252,32 +1782,154 @@ class Recommendation(Base):
     course = relationship('Course', foreign_keys=[course_id])
     rating = relationship('RecommendationRating', uselist=False, back_populates='recommendation')
 
-    def __init__(self, *, student, course, correctness_probability=0.5, date_generated=date.today()):
+    __table_args__ = (UniqueConstraint('student_id', 'course_id', 'date_generated'),
+                      Index('index_recommendation_student_date', student_id, date_generated.desc()))
+
+    def __init__(self, *, student, course, correctness_probability=0.5, date_generated=None, model_version=None):
         super().__init__()
         self.student = student
         self.course = course
         self.correctness_probability = correctness_probability
-        self.date_generated = date_generated
+        self.date_generated = date_generated if date_generated is not None else date.today()
+        self.model_version = model_version
+
+    @classmethod
+    def get_or_create(cls, session, *, student, course, **values):
+        """Returns the recommendation of the ''course'' generated for the ''student'' today, storing a new one with the
+        given column ''values'' if there is none. The new recommendation is flushed within a savepoint: if a concurrent
+        session stores the same recommendation first, the unique constraint rejects the insert, which is rolled back to
+        the savepoint and the stored recommendation returned instead.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param student: :class:'Student' object the recommendation is generated for.
+        :param course: :class:'Course' object which is recommended.
+        :param values: The other column values of a new recommendation.
+        :return: :class:'Recommendation' object.
+        """
+        try:
+            with session.begin_nested():
+                recommendation = cls(student=student, course=course, **values)
+                session.add(recommendation)
+            return recommendation
+        except IntegrityError:
+            return session.query(cls).filter_by(student_id=student.id, course_id=course.id,
+                                                date_generated=date.today()).one()
+
+    @classmethod
+    def generated_on(cls, date_generated, students, session, chunk_size=500):
+        """Retrieves the recommendations generated for the ''students'' on a given date.
+
+        :param date_generated: The date the recommendations were generated on.
+        :param students: List of :class:'Student' objects.
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param chunk_size: The maximum number of students looked up with a single query.
+        :return: A dictionary mapping (student id, course id) pairs to :class:'Recommendation' objects.
+        """
+        student_ids = [student.id for student in students if student.id is not None]
+        recommendations = {}
+        for start in range(0, len(student_ids), chunk_size):
+            query = session.query(cls).filter(cls.student_id.in_(student_ids[start:start + chunk_size]),
+                                              cls.date_generated == date_generated)
+            for recommendation in query:
+                recommendations[recommendation.student_id, recommendation.course_id] = recommendation
+        return recommendations
+
+    @classmethod
+    def latest_for(cls, student, session):
+        """Retrieves the recommendations generated for a ''student'' on the latest date any were generated on. Both
+        lookups are served by the (student, date generated) index.
+
+        :param student: :class:'Student' object.
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :return: List of :class:'Recommendation' objects, the most probably correct first.
+        """
+        latest_date = session.query(func.max(cls.date_generated)).filter(cls.student_id == student.id).scalar()
+        if latest_date is None:
+            return []
+        return session.query(cls).filter(cls.student_id == student.id, cls.date_generated == latest_date)\
+            .order_by(cls.correctness_probability.desc()).all()
+
+    @classmethod
+    def compact(cls, session, older_than, university=None, archive=True, commit=True):
+        """Removes, in bulk, the recommendations generated before the date ''older_than'' which have not been rated.
+        The rated recommendations are always kept, so that the :class:'RecommendationFeedback' counters remain valid.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param older_than: The recommendations generated before this date are removed.
+        :param university: If given, only the recommendations made to the students of this :class:'University' are
+        removed.
+        :param archive: Whether to copy the removed recommendations to the :class:'ArchivedRecommendation' table.
+        :param commit: If True writes the changes to the database.
+        :return: The number of removed recommendations.
+
+        The removed recommendations loaded in the ''session'' are expunged from it, and removed from the loaded
+        ''recommendations'' of their students.
+        """
+        from student import Student
+
+        condition = and_(cls.date_generated < older_than,
+                         ~exists().where(RecommendationRating.recommendation_id == cls.id))
+        if university is not None:
+            condition = and_(condition, cls.student_id.in_(select([Student.id])
+                                                           .where(Student.university_id == university.id)))
+
+        if archive:
+            columns = ['correctness_probability', 'date_generated', 'model_version', 'course_id', 'student_id']
+            archived = select([cls.id] + [getattr(cls, column) for column in columns] + [literal(date.today())])\
+                .where(condition)
+            session.execute(ArchivedRecommendation.__table__.insert()
+                            .from_select(['original_id'] + columns + ['date_archived'], archived))
+        removed = session.query(cls).filter(condition).delete(synchronize_session=False)
+        expunge_deleted(session, cls)
+
+        if commit:
+            commit_or_defer(session)
+        return removed
 
     def add_rating(self, rating_value, session, commit=True):
-        """Rate this recommendation.
+        """Rate this recommendation. The :class:'RecommendationFeedback' counters are updated in the same transaction.
+        If the recommendation has already been rated, the previous rating is replaced and no longer counted.
 
         :param rating_value: One of :class:'Ratings' values.
         :param session: SQLAlchemy session object allowing to issue queries against the database.
         :param commit: If True writes the generated objects to the database.
         """
         assert type(rating_value) is Ratings, 'Please use a valid rating'
+        if self.rating is not None:
+            RecommendationFeedback.record(self, self.rating.rating, session, delta=-1)
         self.rating = RecommendationRating(recommendation=self, rating=rating_value)
 
         session.add(self.rating)
+        RecommendationFeedback.record(self, rating_value, session)
         if commit:
-            session.commit()
+            commit_or_defer(session)
 
     def __str__(self):
         return f'{self.course.course_number}, P={self.correctness_probability}, ' \
                f'Rating={self.rating.rating if self.rating is not None else "None"}, Date={self.date_generated}'
 
 
+class ArchivedRecommendation(Base):
+    """Represents a :class:'Recommendation' which was never rated, moved out of the recommendation table by
+    :class:'Recommendation'.''compact''. The ''original_id'' is the identifier the recommendation had, which may since
+    have been reused by another recommendation.
+    """
+    __tablename__ = 'recommendation_archive'
+
+    id = Column(Integer, primary_key=True)
+    original_id = Column(Integer, index=True)
+    correctness_probability = Column(Float(2))
+    date_generated = Column(Date)
+    model_version = Column(Integer)
+    course_id = Column(Integer)
+    student_id = Column(Integer)
+    date_archived = Column(Date)
+
+    def __str__(self):
+        return f'Archived recommendation of course {self.course_id} to student {self.student_id}, ' \
+               f'P={self.correctness_probability}, Date={self.date_generated}'
+
+
 class Ratings(enum.Enum):
     """Represents the possible ratings which can be added as a :class:'RecommendationRating'.
     """
@@ -309,3 +1961,247 @@ class RecommendationRating(Base):
         self.rating = rating
         self.date_added = date.today()
 
+
+class FeedbackScope(enum.Enum):
+    """Represents the dimensions along which the ratings of :class:'Recommendation' objects are aggregated, used as the
+    ''scope'' attribute of :class:'RecommendationFeedback'.
+    """
+    UNIVERSITY = 'university'
+    COURSE = 'course'
+    MODEL_VERSION = 'model version'
+    DATE_GENERATED = 'date generated'
+
+    def __str__(self):
+        return self.value
+
+
+class RecommendationFeedback(Base):
+    """Represents the number of helpful and not helpful ratings of the recommendations made at a university, aggregated
+    along one of the :class:'FeedbackScope' dimensions. The counters are maintained incrementally by
+    :class:'Recommendation'.''add_rating'', hence reading them never requires scanning the ratings themselves.
+
+    :param scope: The :class:'FeedbackScope' dimension the counters are aggregated along.
+    :param university_id: Identifier of the :class:'University' the counted recommendations were made at.
+    :param course_id: Identifier of the recommended :class:'Course' (only set for ''FeedbackScope.COURSE'').
+    :param model_version: Version of the model which generated the recommendations (only set for
+    ''FeedbackScope.MODEL_VERSION'').
+    :param date_generated: Date the recommendations were generated on (only set for ''FeedbackScope.DATE_GENERATED'').
+
+    Each counter is also identified by a non-null ''counter_key'' (the value of the key column of its scope as a
+    string), so that a unique constraint prevents concurrent sessions from creating the same counter twice.
+    """
+    __tablename__ = 'recommendation_feedback'
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(Enum(FeedbackScope), nullable=False)
+    helpful = Column(Integer, nullable=False)
+    not_helpful = Column(Integer, nullable=False)
+    university_id = Column(Integer, ForeignKey('university.id'), nullable=False)
+    course_id = Column(Integer, ForeignKey('course.id'), nullable=True)
+    model_version = Column(Integer, nullable=True)
+    date_generated = Column(Date, nullable=True)
+    counter_key = Column(String(40), nullable=False)
+
+    university = relationship('University', foreign_keys=[university_id])
+    course = relationship('Course', foreign_keys=[course_id])
+
+    __table_args__ = (Index('index_recommendation_feedback', university_id, scope, course_id, model_version,
+                            date_generated),
+                      UniqueConstraint(university_id, scope, counter_key))
+
+    def __init__(self, *, scope, university_id, course_id=None, model_version=None, date_generated=None,
+                 helpful=0, not_helpful=0):
+        super().__init__()
+        self.scope = scope
+        self.university_id = university_id
+        self.course_id = course_id
+        self.model_version = model_version
+        self.date_generated = date_generated
+        self.counter_key = RecommendationFeedback._counter_key(scope, course_id=course_id, model_version=model_version,
+                                                               date_generated=date_generated)
+        self.helpful = helpful
+        self.not_helpful = not_helpful
+
+    @property
+    def total(self):
+        """Attribute returning the number of counted ratings."""
+        return self.helpful + self.not_helpful
+
+    @property
+    def helpful_rate(self):
+        """Attribute returning the fraction of the counted ratings which are ''Ratings.HELPFUL'', or ''None'' if no
+        ratings have been counted.
+        """
+        return self.helpful / self.total if self.total else None
+
+    @staticmethod
+    def _scope_keys(recommendation):
+        """Returns the values of the key columns identifying the counters a ''recommendation'' contributes to, for
+        each :class:'FeedbackScope'. The key columns which do not apply to a scope are ''None''.
+        """
+        keys = dict(university_id=recommendation.course.university_id, course_id=None, model_version=None,
+                    date_generated=None)
+        return {
+            FeedbackScope.UNIVERSITY: keys,
+            FeedbackScope.COURSE: dict(keys, course_id=recommendation.course_id),
+            FeedbackScope.MODEL_VERSION: dict(keys, model_version=recommendation.model_version),
+            FeedbackScope.DATE_GENERATED: dict(keys, date_generated=recommendation.date_generated),
+        }
+
+    @staticmethod
+    def _counter_key(scope, *, course_id=None, model_version=None, date_generated=None, **_):
+        """Returns the ''counter_key'' of the counter with the given key column values in the ''scope''."""
+        value = {FeedbackScope.UNIVERSITY: None, FeedbackScope.COURSE: course_id,
+                 FeedbackScope.MODEL_VERSION: model_version, FeedbackScope.DATE_GENERATED: date_generated}[scope]
+        return '' if value is None else str(value)
+
+    @classmethod
+    def _add(cls, session, scope, keys, helpful=0, not_helpful=0):
+        """Adds to the counters of the ''scope'' identified by the key column values ''keys''. The counters are
+        incremented in SQL, so that concurrent sessions do not overwrite each other's updates, and created if they do
+        not exist yet. If a concurrent session creates them first, the unique constraint rejects the second insert,
+        which is rolled back to a savepoint and replaced by an increment.
+        """
+        def increment():
+            return session.query(cls)\
+                .filter_by(university_id=keys['university_id'], scope=scope,
+                           counter_key=cls._counter_key(scope, **keys))\
+                .update({cls.helpful: cls.helpful + helpful, cls.not_helpful: cls.not_helpful + not_helpful},
+                        synchronize_session='evaluate')
+
+        if increment():
+            return
+        try:
+            with session.begin_nested():
+                session.add(cls(scope=scope, helpful=helpful, not_helpful=not_helpful, **keys))
+        except IntegrityError:
+            increment()
+
+    @classmethod
+    def record(cls, recommendation, rating_value, session, delta=1):
+        """Adds ''delta'' to the counters of ''rating_value'' ratings in each scope the ''recommendation'' belongs to.
+        Existing counters are incremented in SQL, so that concurrent sessions do not overwrite each other's updates, and
+        a counter is only ever created once (see ''counter_key'').
+
+        :param recommendation: :class:'Recommendation' object which has been rated.
+        :param rating_value: One of :class:'Ratings' values.
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param delta: The value to add to the counters (-1 when a rating is withdrawn).
+        """
+        column = 'helpful' if rating_value is Ratings.HELPFUL else 'not_helpful'
+        # The recommendation and its course must have been assigned identifiers before they can be counted
+        session.flush()
+        for scope, keys in cls._scope_keys(recommendation).items():
+            cls._add(session, scope, keys, **{column: delta})
+
+    @classmethod
+    def for_university(cls, university, session, scope=FeedbackScope.UNIVERSITY, start_date=None, end_date=None):
+        """Retrieves the counters of a ''university'' aggregated along the given ''scope''. The lookup is served by an
+        index, hence its cost depends only on the number of rows returned.
+
+        :param university: :class:'University' object whose counters to retrieve.
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param scope: One of :class:'FeedbackScope' values (default: ''FeedbackScope.UNIVERSITY'').
+        :param start_date: If given, only counters of recommendations generated on or after this date are returned
+        (only applies to ''FeedbackScope.DATE_GENERATED'').
+        :param end_date: If given, only counters of recommendations generated on or before this date are returned
+        (only applies to ''FeedbackScope.DATE_GENERATED'').
+        :return: List of :class:'RecommendationFeedback' objects.
+        """
+        query = session.query(cls).filter(cls.university_id == university.id, cls.scope == scope)
+        if start_date is not None:
+            query = query.filter(cls.date_generated >= start_date)
+        if end_date is not None:
+            query = query.filter(cls.date_generated <= end_date)
+        return query.order_by(cls.course_id, cls.model_version, cls.date_generated).all()
+
+    @classmethod
+    def for_course(cls, course, session):
+        """Retrieves the counter of a single ''course'', or ''None'' if none of its recommendations have been rated.
+
+        :param course: :class:'Course' object whose counter to retrieve.
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :return: :class:'RecommendationFeedback' object or ''None''.
+        """
+        return session.query(cls).filter(cls.university_id == course.university_id,
+                                         cls.scope == FeedbackScope.COURSE, cls.course_id == course.id).first()
+
+    @staticmethod
+    def _count_ratings(session, scope, condition=None):
+        """Counts the stored :class:'RecommendationRating' objects (optionally only the ones satisfying the SQL
+        ''condition'') along the ''scope'' with a single aggregate query.
+
+        :return: List of rows with the columns ''university_id'', the key column of the ''scope'' (if any),
+        ''helpful'' and ''not_helpful''.
+        """
+        from university import Course
+
+        columns = {FeedbackScope.UNIVERSITY: [], FeedbackScope.COURSE: [Recommendation.course_id],
+                   FeedbackScope.MODEL_VERSION: [Recommendation.model_version],
+                   FeedbackScope.DATE_GENERATED: [Recommendation.date_generated]}[scope]
+        helpful = func.sum(case([(RecommendationRating.rating == Ratings.HELPFUL, 1)], else_=0))
+        not_helpful = func.sum(case([(RecommendationRating.rating == Ratings.NOT_HELPFUL, 1)], else_=0))
+        query = session.query(Course.university_id, *columns, helpful.label('helpful'),
+                              not_helpful.label('not_helpful'))\
+            .select_from(RecommendationRating)\
+            .join(Recommendation, RecommendationRating.recommendation_id == Recommendation.id)\
+            .join(Course, Recommendation.course_id == Course.id)
+        if condition is not None:
+            query = query.filter(condition)
+        return query.group_by(Course.university_id, *columns).all()
+
+    @classmethod
+    def withdraw(cls, session, recommendation_ids):
+        """Subtracts the ratings of the given recommendations from the counters, before the recommendations or their
+        ratings are deleted in bulk. Only the ratings being withdrawn are read, and the counters left at zero are
+        removed.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param recommendation_ids: A SQL selectable (e.g. ''select([Recommendation.id]).where(...)'') of the identifiers
+        of the recommendations.
+        """
+        university_ids = set()
+        for scope in FeedbackScope:
+            withdrawn = RecommendationRating.recommendation_id.in_(recommendation_ids)
+            for row in cls._count_ratings(session, scope, withdrawn):
+                keys = dict(dict(course_id=None, model_version=None, date_generated=None), **row._asdict())
+                helpful, not_helpful = keys.pop('helpful'), keys.pop('not_helpful')
+                cls._add(session, scope, keys, helpful=-helpful, not_helpful=-not_helpful)
+                university_ids.add(keys['university_id'])
+        if university_ids:
+            session.query(cls).filter(cls.university_id.in_(university_ids), cls.helpful == 0, cls.not_helpful == 0)\
+                .delete(synchronize_session='fetch')
+
+    @classmethod
+    def rebuild(cls, session, university=None, commit=True):
+        """Recomputes the counters from the stored :class:'RecommendationRating' objects, replacing the existing ones.
+        Meant for backfills, or for repairing the counters after the ratings have been modified in bulk.
+
+        :param session: SQLAlchemy session object allowing to issue queries against the database.
+        :param university: :class:'University' object whose counters to rebuild. If ''None'', the counters of all
+        universities are rebuilt.
+        :param commit: If True writes the changes to the database.
+        """
+        from university import Course
+
+        delete_query = session.query(cls)
+        if university is not None:
+            delete_query = delete_query.filter(cls.university_id == university.id)
+        delete_query.delete(synchronize_session=False)
+
+        for scope in FeedbackScope:
+            rows = cls._count_ratings(session, scope, None if university is None else
+                                      Course.university_id == university.id)
+            session.bulk_insert_mappings(cls, [dict(row._asdict(), scope=scope,
+                                                    counter_key=cls._counter_key(scope, **row._asdict()))
+                                               for row in rows])
+
+        if commit:
+            commit_or_defer(session)
+
+    def __str__(self):
+        key = {FeedbackScope.UNIVERSITY: 'all courses',
+               FeedbackScope.COURSE: f'course {self.course.course_number if self.course is not None else None}',
+               FeedbackScope.MODEL_VERSION: f'model version {self.model_version}',
+               FeedbackScope.DATE_GENERATED: f'generated {self.date_generated}'}[self.scope]
+        return f'Feedback ({key}): helpful={self.helpful}, not helpful={self.not_helpful}'
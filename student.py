@@ -3,8 +3,9 @@ from sqlalchemy import Column, Integer, String, ForeignKey, Date
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.associationproxy import association_proxy
 
-from utils import Base
+from utils import Base, commit_or_defer, reload_or_defer
 from person import Person
+from recommender import Recommendation
 
 
 class Student(Person):
@@ -88,34 +89,48 @@ class Student(Person):
         :param reload_ratings: Whether to reload the student-course matrix in the :class:'RecommendationSystem' instance
         corresponding to the :class:'University' instance this student studies at, so as to include the new added
         rating. For efficiency reasons, it is best to add multiple ratings in a batch and only then reload the matrix
-        by calling :class:'RecommendationSystem'.''reload_ratings'' (default: True).
+        by calling :class:'RecommendationSystem'.''reload_ratings'', or to rate the courses within
+        :class:'University'.''batch'', which reloads the matrix once at its end (default: True).
 
         """
         assert rating in range(1, 11), 'Rating must be an integer in range [1, 10].'
         assert enrollment.student is self, 'Cannot rate a course this student is not enrolled in.'
         enrollment.course_rating = rating
         if commit:
-            session.commit()
+            commit_or_defer(session)
         if reload_ratings:
-            self.university.recommendation_system.reload_ratings()
+            reload_or_defer(self.university.recommendation_system, session)
 
-    def generate_recommendations(self, session, number_recommendations=3, commit=True):
+    def generate_recommendations(self, session, number_recommendations=3, commit=True, electives_only=True,
+                                 eligible_only=False):
         """Generates recommendations for this :class:'Student' object.
 
         :param session: SQLAlchemy :class:'Session' object allowing to issue queries against the database.
         :param number_recommendations: Number fo recommendations to generate.
         :param commit: If True writes the generated objects to the database.
+        :param electives_only: Whether to only recommend elective courses (default: True).
+        :param eligible_only: Whether to only recommend courses available in a semester this student has not completed
+        yet (default: False).
         :return: A tuple of :class:'Recommendation' objects.
         """
         recommendations = self.university. \
             recommendation_system. \
-            generate_recommendations(student=self, session=session, number_recommendations=number_recommendations)
+            generate_recommendations(student=self, session=session, number_recommendations=number_recommendations,
+                                     electives_only=electives_only, eligible_only=eligible_only)
 
         session.add_all(recommendations)
         if commit:
-            session.commit()
+            commit_or_defer(session)
         return recommendations
 
+    def latest_recommendations(self, session):
+        """Retrieves the recommendations most recently generated for this :class:'Student' object.
+
+        :param session: SQLAlchemy :class:'Session' object allowing to issue queries against the database.
+        :return: List of :class:'Recommendation' objects.
+        """
+        return Recommendation.latest_for(self, session)
+
     def __str__(self):
         return f"{' '.join([name.name for name in self.names])} {self.surname} ({self.student_number}) " \
                f"Term: {self.terms_completed}"
@@ -0,0 +1,51 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# The modules of the project are imported from the project directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address import Address  # noqa: E402
+from database import create_database_engine, create_session_factory  # noqa: E402
+from university import University, UniversityType  # noqa: E402
+from utils import Base  # noqa: E402
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A session of a new SQLite database. The recommender files are written to the temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    engine = create_database_engine(f'sqlite:///{tmp_path / "test.db"}')
+    Base.metadata.create_all(engine)
+    session = create_session_factory(engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def university(session):
+    """A university with 6 students enrolled in some of its 5 courses, most of which they have rated, and its ratings
+    reloaded.
+    """
+    address = Address(country='United Kingdom', city='London', address_line='Houghton Street', postal_code='WC2A 2AE')
+    university = University(name='Test University', category=UniversityType.PUBLIC, abbreviation='TU',
+                            address=address, username='uni', password='pw')
+    session.add_all([address, university])
+    courses = [university.add_course(name=f'Course {i}', course_number=f'C{i}', semester_of_availability=i % 4 + 1)
+               for i in range(5)]
+    students = [university.register_student(name=f'Name{i} Surname', student_number=f'S{i}', terms_completed=2,
+                                            username=f'student{i}', password='pw')
+                for i in range(6)]
+    session.add_all(courses + students)
+    for i, student in enumerate(students):
+        for j, course in enumerate(courses):
+            if (i + j) % 3:
+                enrollment = course.add_student(student=student, start_date=date(2020, 2, 13))
+                enrollment.course_rating = (3 * i + j) % 10 + 1 if (i + 2 * j) % 4 else None
+    session.commit()
+    university.recommendation_system.reload_ratings()
+    session.commit()
+    return university
@@ -0,0 +1,59 @@
+import pytest
+
+
+@pytest.fixture(params=[False, True], ids=['untrained', 'trained'])
+def recommendation_system(request, university, session):
+    """The recommendation system of the university with a compulsory course added, scoring the courses with the
+    course ranking (untrained) or with the model (trained).
+    """
+    session.add(university.add_course(name='Compulsory', course_number='C5', semester_of_availability=3,
+                                      is_elective=False))
+    session.commit()
+    recommendation_system = university.recommendation_system
+    recommendation_system.reload_ratings()
+    if request.param:
+        recommendation_system.train_model(epochs=3)
+    return recommendation_system
+
+
+def recommended_courses(university, session, **constraints):
+    return {student.student_number: [recommendation.course.course_number for recommendation in recommendations]
+            for student, recommendations in university.generate_recommendations(session, commit=False,
+                                                                                 **constraints).items()}
+
+
+def enrolled_in(student):
+    return {enrollment.course.course_number for enrollment in student.enrollments}
+
+
+def test_candidate_masks(recommendation_system):
+    ranking = recommendation_system.open_snapshot().course_ranking
+    courses = ranking.courses.index
+
+    def allowed(**constraints):
+        return set(courses[ranking.candidate_mask(**constraints)])
+
+    assert allowed(electives_only=False) == {'C0', 'C1', 'C2', 'C3', 'C4', 'C5'}
+    assert allowed() == {'C0', 'C1', 'C2', 'C3', 'C4'}
+    # Semesters of availability: C0 and C4 in 1, C1 in 2, C2 and C5 in 3, C3 in 4
+    assert allowed(terms_completed=2) == {'C2', 'C3'}
+    assert allowed(electives_only=False, terms_completed=2) == {'C2', 'C3', 'C5'}
+    assert allowed(terms_completed=0) == allowed()
+    assert allowed(terms_completed=10) == set()
+
+
+def test_recommendations_exclude_compulsory_and_enrolled_in_courses(recommendation_system, university, session):
+    recommendations = recommended_courses(university, session)
+    for student in university.students:
+        assert recommendations[student.student_number]
+        assert not set(recommendations[student.student_number]) & (enrolled_in(student) | {'C5'})
+
+    recommendations = recommended_courses(university, session, electives_only=False)
+    assert any('C5' in courses for courses in recommendations.values())
+
+
+def test_eligible_recommendations_are_available_in_a_later_semester(recommendation_system, university, session):
+    recommendations = recommended_courses(university, session, eligible_only=True, electives_only=False)
+    for student in university.students:
+        assert student.terms_completed == 2
+        assert set(recommendations[student.student_number]) == {'C2', 'C3', 'C5'} - enrolled_in(student)
@@ -0,0 +1,29 @@
+from instrumentation import Instrumentation
+from recommender import Checkpoint
+
+
+def test_prune_keeps_the_snapshot_of_a_checkpointed_run(university, session):
+    recommendation_system = university.recommendation_system
+    instrumentation = Instrumentation()
+
+    def interrupt(statistics):
+        if statistics['epoch'] == 2:
+            raise KeyboardInterrupt
+
+    instrumentation.add_epoch_callback(interrupt)
+    recommendation_system.instrumentation = instrumentation
+    try:
+        recommendation_system.train_model(epochs=6)
+    except KeyboardInterrupt:
+        pass
+    recommendation_system.instrumentation = None
+    checkpointed = Checkpoint.snapshot_version_of(recommendation_system._checkpoint_path)
+
+    for _ in range(recommendation_system.retained_snapshots + 2):
+        recommendation_system.reload_ratings(force=True)
+    assert checkpointed in recommendation_system.snapshot_versions()
+
+    recommendation_system.instrumentation = Instrumentation()
+    recommendation_system.train_model(epochs=6, resume=True)
+    assert [statistics['epoch'] for statistics in recommendation_system.instrumentation.epochs] == [2, 3, 4, 5]
+    assert Checkpoint.snapshot_version_of(recommendation_system._checkpoint_path) is None
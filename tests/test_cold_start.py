@@ -0,0 +1,74 @@
+from datetime import date
+
+import pytest
+
+from address import Address
+from university import University, UniversityType
+
+
+@pytest.fixture
+def new_university(session):
+    """A university with courses, but none of whose students has enrolled in any course yet, and its model trained."""
+    address = Address(country='United Kingdom', city='Cambridge', address_line='Trinity Lane', postal_code='CB2 1TN')
+    university = University(name='New University', category=UniversityType.PUBLIC, abbreviation='NU',
+                            address=address, username='new', password='pw')
+    courses = [university.add_course(name=f'Course {i}', course_number=f'N{i}', semester_of_availability=1)
+               for i in range(3)]
+    student = university.register_student(name='First Student', student_number='F0', terms_completed=0,
+                                          username='first', password='pw')
+    session.add_all([address, university, student] + courses)
+    session.commit()
+    university.recommendation_system.reload_ratings()
+    university.recommendation_system.train_model(epochs=2)
+    session.commit()
+    return university
+
+
+def test_new_university_recommends_its_courses(new_university, session):
+    recommendations = new_university.students[0].generate_recommendations(session)
+    assert {recommendation.course.course_number for recommendation in recommendations} == {'N0', 'N1', 'N2'}
+    assert all(0 <= recommendation.correctness_probability <= 1 for recommendation in recommendations)
+
+
+def test_new_university_recommends_new_courses_to_new_students(new_university, session):
+    new_university.add_course(name='Course 3', course_number='N3', semester_of_availability=1)
+    student = new_university.register_student(name='Second Student', student_number='F1', terms_completed=0,
+                                              username='second', password='pw')
+    session.add(student)
+    session.commit()
+    new_university.recommendation_system.reload_ratings()
+
+    assert 'N3' in new_university.recommendation_system.open_snapshot().course_ranking.positions
+    recommendations = new_university.generate_recommendations(session)
+    assert [len(student_recommendations) for student_recommendations in recommendations.values()] == [3, 3]
+
+
+def test_students_missing_from_the_model_are_recommended_the_most_popular_courses(university, session):
+    university.recommendation_system.train_model(epochs=2)
+    student = university.register_student(name='Late Student', student_number='S9', terms_completed=0,
+                                          username='late', password='pw')
+    session.add(student)
+    university.courses[0].add_student(student=student, start_date=date(2021, 2, 13))
+    session.commit()
+    university.recommendation_system.reload_ratings()
+
+    ranking = university.recommendation_system.open_snapshot().course_ranking
+    expected = ranking.top(3, exclude={'C0'}, allowed=ranking.candidate_mask(electives_only=True))
+    recommendations = student.generate_recommendations(session)
+    assert [recommendation.course.course_number for recommendation in recommendations] == list(expected)
+
+
+def test_courses_added_since_training_are_scored_by_their_mean_rating(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+    course = university.add_course(name='Course 5', course_number='C5', semester_of_availability=1)
+    session.add(course)
+    session.commit()
+    recommendation_system.reload_ratings()
+
+    snapshot = recommendation_system.open_snapshot()
+    scorer = snapshot.course_scorer
+    column = snapshot.course_ranking.positions['C5']
+    assert scorer.new_courses[column] and scorer.new_courses.sum() == 1
+    scores = scorer.scores([scorer.student_rows['S0']])
+    assert scores[0, column] == snapshot.course_ranking.courses.loc['C5', 'mean_rating']
@@ -0,0 +1,117 @@
+import pytest
+
+from person import Name
+from recommender import Recommendation, RecommendationRating, RecommendationFeedback, Ratings
+from student import Student, StudentCourse
+from university import Course
+
+
+def rate_recommendations(university, session):
+    """Trains the model, generates recommendations for all the students and rates one of each student's."""
+    university.recommendation_system.train_model(epochs=3)
+    recommendations = university.generate_recommendations(session)
+    for i, student_recommendations in enumerate(recommendations.values()):
+        student_recommendations[0].add_rating(Ratings.HELPFUL if i % 2 else Ratings.NOT_HELPFUL, session)
+    return recommendations
+
+
+def counters(session):
+    return sorted((str(counter.scope), counter.counter_key, counter.helpful, counter.not_helpful)
+                  for counter in session.query(RecommendationFeedback))
+
+
+@pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')
+def test_delete_students_removes_all_their_rows(university, session):
+    rate_recommendations(university, session)
+    deleted = university.students[:2]
+    deleted_ids = [student.id for student in deleted]
+
+    university.delete_students(deleted, session)
+
+    assert session.query(Student).filter(Student.id.in_(deleted_ids)).count() == 0
+    assert session.query(Name).filter(Name.person_id.in_(deleted_ids)).count() == 0
+    assert session.query(StudentCourse).filter(StudentCourse.student_id.in_(deleted_ids)).count() == 0
+    assert session.query(Recommendation).filter(Recommendation.student_id.in_(deleted_ids)).count() == 0
+    assert len(university.students) == 4
+    assert not set(university.recommendation_system.student_course_matrix.index) & {'S0', 'S1'}
+    assert not set(university.recommendation_system.parameters[1].index) & {'S0', 'S1'}
+
+
+@pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')
+def test_deleted_dependents_leave_the_session(university, session):
+    rate_recommendations(university, session)
+    student = university.students[0]
+    loaded = list(student.recommendations) + list(student.enrollments) + list(student.names)
+
+    university.delete_student(student, session)
+
+    assert not any(instance in session for instance in loaded + [student])
+    # The identifiers of the deleted rows are reused without clashing with stale objects
+    university.generate_recommendations(session)
+    university.generate_recommendations(session)
+
+
+def test_deletions_subtract_the_ratings_from_the_counters(university, session):
+    rate_recommendations(university, session)
+
+    university.delete_student(university.students[0], session)
+    university.delete_course(university.courses[0], session)
+    incremental = counters(session)
+
+    RecommendationFeedback.rebuild(session)
+    assert incremental == counters(session)
+    assert session.query(RecommendationRating).count() == sum(counter[2] + counter[3] for counter in incremental
+                                                              if counter[0] == 'university')
+
+
+def test_deletions_within_a_batch_update_the_recommendation_system_once(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+    versions = recommendation_system.snapshot_versions()
+
+    with university.batch(session):
+        university.delete_student(university.students[0], session)
+        university.delete_course(university.courses[0], session)
+
+    assert len(set(recommendation_system.snapshot_versions()) - set(versions)) == 1
+    assert 'S0' not in recommendation_system.parameters[1].index
+    assert 'C0' not in recommendation_system.parameters[0].index
+    assert session.query(Course).filter(Course.course_number == 'C0').count() == 0
+
+
+def test_deletions_can_leave_the_recommendation_system_unchanged(university, session):
+    recommendation_system = university.recommendation_system
+    version = recommendation_system.open_snapshot().version
+
+    university.delete_student(university.students[0], session, update_recommendation_system=False)
+
+    assert recommendation_system.open_snapshot().version == version
+    assert session.query(Student).count() == 5
+
+
+def test_uncommitted_deletions_update_the_recommendation_system_once_committed(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+
+    university.delete_student(university.students[0], session, commit=False)
+    assert 'S0' in recommendation_system.parameters[1].index
+    # Savepoints released in the meantime do not commit the deletion
+    university.generate_recommendations(session, commit=False)
+    assert 'S0' in recommendation_system.parameters[1].index
+
+    session.commit()
+    assert 'S0' not in recommendation_system.parameters[1].index
+
+
+def test_rolled_back_deletions_leave_the_recommendation_system_unchanged(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+    version = recommendation_system.open_snapshot().version
+
+    university.delete_student(university.students[0], session, commit=False)
+    session.rollback()
+    session.commit()
+
+    assert session.query(Student).count() == 6
+    assert recommendation_system.open_snapshot().version == version
+    assert 'S0' in recommendation_system.parameters[1].index
@@ -0,0 +1,58 @@
+from datetime import date
+
+import numpy as np
+
+from evaluation import split_ratings, hyperparameter_search
+from recommender import RecommendationSystem
+
+
+def test_split_holds_out_some_ratings_of_each_student(university):
+    known_ratings_matrix = university.recommendation_system.known_ratings_matrix
+    train, test = split_ratings(known_ratings_matrix, test_fraction=0.5, random_state=0)
+
+    assert len(train) + len(test) == len(known_ratings_matrix)
+    counts = known_ratings_matrix.iloc[:, 0].value_counts()
+    held_out = test.iloc[:, 0].value_counts()
+    for student_number, count in counts.items():
+        assert held_out.get(student_number, 0) == (max(1, count // 2) if count >= 2 else 0)
+
+
+def test_search_reads_a_single_snapshot(university, session, monkeypatch):
+    recommendation_system = university.recommendation_system
+    open_snapshot = RecommendationSystem.open_snapshot
+    opened = []
+
+    def open_snapshot_then_publish(self, version=None):
+        snapshot = open_snapshot(self, version)
+        opened.append(snapshot)
+        if len(opened) == 1:
+            # A student rates a course (publishing a new snapshot) while the search reads the ratings
+            student = university.register_student(name='Late Student', student_number='S9', terms_completed=0,
+                                                  username='late', password='pw')
+            session.add(student)
+            university.courses[0].add_student(student=student, start_date=date(2021, 2, 13)).course_rating = 5
+            session.commit()
+            recommendation_system.reload_ratings()
+        return snapshot
+
+    monkeypatch.setattr(RecommendationSystem, 'open_snapshot', open_snapshot_then_publish)
+    trials = hyperparameter_search(recommendation_system, {'number_factors': [2, 3], 'epochs': [3]}, processes=1,
+                                   random_state=0)
+
+    assert [trial.hyperparameters['number_factors'] for trial in trials] in ([2, 3], [3, 2])
+    assert all(np.isfinite(trial.rmse) for trial in trials)
+    assert [trial.rmse for trial in trials] == sorted(trial.rmse for trial in trials)
+
+
+def test_trials_minimize_the_loss_of_the_recommendation_system(university):
+    recommendation_system = university.recommendation_system
+    recommendation_system.loss_function = 'huber'
+
+    # The hyperparameters of a trial are the keyword arguments of factorize
+    trials = hyperparameter_search(recommendation_system, {'epochs': [2]}, processes=1, random_state=0)
+    assert [trial.hyperparameters for trial in trials] == [{'loss': 'huber', 'epochs': 2}]
+
+    trials = hyperparameter_search(recommendation_system, {'epochs': [2], 'loss': ['mse', 'weighted_mse']},
+                                   processes=1, random_state=0)
+    assert sorted(trial.hyperparameters['loss'] for trial in trials) == ['mse', 'weighted_mse']
+    assert trials[0].rmse != trials[1].rmse
@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from recommender import RecommendationFeedback, FeedbackScope, Ratings
+
+
+@pytest.fixture
+def recommendations(university, session):
+    university.recommendation_system.train_model(epochs=3)
+    return university.generate_recommendations(session)
+
+
+def test_feedback_counters_are_incremented_in_place(university, session, recommendations):
+    first, second = [student_recommendations[0] for student_recommendations in list(recommendations.values())[:2]]
+    first.add_rating(Ratings.HELPFUL, session)
+    second.add_rating(Ratings.HELPFUL, session)
+    first.add_rating(Ratings.NOT_HELPFUL, session)
+
+    counter, = RecommendationFeedback.for_university(university, session)
+    assert (counter.helpful, counter.not_helpful) == (1, 1)
+    assert session.query(RecommendationFeedback).filter_by(scope=FeedbackScope.UNIVERSITY).count() == 1
+
+
+def test_feedback_counters_are_unique(university, session, recommendations):
+    next(iter(recommendations.values()))[0].add_rating(Ratings.HELPFUL, session)
+    session.add(RecommendationFeedback(scope=FeedbackScope.UNIVERSITY, university_id=university.id))
+    with pytest.raises(IntegrityError):
+        session.flush()
+    session.rollback()
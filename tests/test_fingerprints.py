@@ -0,0 +1,69 @@
+from recommender import RecommendationSystem
+from student import StudentCourse
+
+
+def rated_enrollments(session):
+    return session.query(StudentCourse).filter(StudentCourse.course_rating.between(2, 9))\
+        .order_by(StudentCourse.student_id, StudentCourse.course_id).all()
+
+
+def test_unchanged_ratings_are_not_reloaded(university):
+    recommendation_system = university.recommendation_system
+    version = recommendation_system.open_snapshot().version
+
+    assert recommendation_system.reload_ratings() is False
+    assert recommendation_system.open_snapshot().version == version
+    assert recommendation_system.reload_ratings(force=True) is True
+    assert recommendation_system.open_snapshot().version != version
+
+
+def test_up_to_date_model_is_not_retrained(university):
+    recommendation_system = university.recommendation_system
+    assert len(recommendation_system.train_model(epochs=3)) == 3
+    version = recommendation_system.open_snapshot().version
+
+    assert recommendation_system.train_model(epochs=3) == []
+    assert recommendation_system.open_snapshot().version == version
+    assert len(recommendation_system.train_model(epochs=4)) == 4
+    assert len(recommendation_system.train_model(epochs=4, force=True)) == 4
+
+
+def test_offsetting_rating_changes_are_detected(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=3)
+    session.commit()
+    assert RecommendationSystem.stale(session) == []
+
+    first, second = rated_enrollments(session)[:2]
+    first.course_rating += 1
+    second.course_rating -= 1
+    session.commit()
+
+    assert RecommendationSystem.stale(session) == [recommendation_system]
+    assert recommendation_system.reload_ratings() is True
+    assert len(recommendation_system.train_model(epochs=3)) == 3
+    session.commit()
+    assert RecommendationSystem.stale(session) == []
+
+
+def test_renamed_students_are_detected(university, session):
+    recommendation_system = university.recommendation_system
+    university.students[0].student_number = 'S100'
+    session.commit()
+
+    assert recommendation_system.reload_ratings() is True
+    assert 'S100' in recommendation_system.student_course_matrix.index
+
+
+def test_removal_invalidates_the_fingerprint(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+    university.delete_student(university.students[0], session)
+
+    assert recommendation_system.open_snapshot().metadata['ratings_fingerprint'] is None
+    assert recommendation_system.reload_ratings() is True
+    assert len(recommendation_system.train_model(epochs=2)) == 2
+
+
+def test_never_trained_systems_with_ratings_are_stale(university, session):
+    assert RecommendationSystem.stale(session) == [university.recommendation_system]
@@ -0,0 +1,48 @@
+import numpy as np
+
+from recommender import factorize_implicit, _conjugate_gradient_rows
+
+
+def test_conjugate_gradient_converges_to_the_weighted_least_squares_solution():
+    random_state = np.random.default_rng(0)
+    number_rows, number_columns, number_factors, regularization = 6, 8, 3, 0.1
+    Y = random_state.normal(size=(number_columns, number_factors))
+    rows, columns = np.nonzero(random_state.random((number_rows, number_columns)) < 0.4)
+    confidences = 1 + 10 * random_state.random(len(rows))
+    X = random_state.normal(size=(number_rows, number_factors))
+
+    _conjugate_gradient_rows(X, Y, rows, columns, confidences, regularization, steps=number_factors)
+
+    C, p = np.ones((number_rows, number_columns)), np.zeros((number_rows, number_columns))
+    C[rows, columns], p[rows, columns] = confidences, 1
+    for row in range(number_rows):
+        expected = np.linalg.solve(Y.T @ (C[row, :, None] * Y) + regularization * np.eye(number_factors),
+                                   Y.T @ (C[row] * p[row]))
+        np.testing.assert_allclose(X[row], expected, rtol=1e-6, atol=1e-8)
+
+
+def test_observed_preferences_are_predicted_higher():
+    # Two groups of students, each enrolled in the courses of its own group
+    students, courses = np.nonzero(np.kron(np.eye(2), np.ones((5, 4))))
+    Q, P, errors = factorize_implicit(students, courses, np.full(len(students), 10.0), number_students=10,
+                                      number_courses=8, number_factors=2, epochs=10, random_state=0)
+
+    assert errors[-1] < errors[0]
+    predictions = P @ Q.T
+    observed = np.zeros(predictions.shape, dtype=bool)
+    observed[students, courses] = True
+    assert predictions[observed].min() > predictions[~observed].max()
+
+
+def test_training_on_implicit_feedback_uses_the_unrated_enrollments(university, session):
+    recommendation_system = university.recommendation_system
+    assert len(recommendation_system.train_model(epochs=3, implicit=True, number_factors=2)) == 3
+
+    snapshot = recommendation_system.open_snapshot()
+    assert snapshot.metadata['feedback'] == 'implicit'
+    # Every enrollment is an observed preference, rated or not
+    enrolled = {enrollment.student.student_number for course in university.courses for enrollment in course.admissions}
+    assert set(snapshot.parameters[1].index) == enrolled
+    recommendations = university.generate_recommendations(session)
+    assert all(0 <= recommendation.correctness_probability <= 1
+               for student_recommendations in recommendations.values() for recommendation in student_recommendations)
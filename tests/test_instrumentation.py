@@ -0,0 +1,45 @@
+import json
+
+from instrumentation import Instrumentation
+
+
+def test_training_reports_every_epoch_and_stage(university, session):
+    recommendation_system = university.recommendation_system
+    reported = []
+    recommendation_system.instrumentation = Instrumentation(epoch_callbacks=[reported.append], labels={'u': 'TU'})
+
+    recommendation_system.train_model(epochs=4)
+    university.generate_recommendations(session)
+
+    instrumentation = recommendation_system.instrumentation
+    assert [statistics['epoch'] for statistics in reported] == [0, 1, 2, 3]
+    assert reported == instrumentation.epochs
+    assert all(statistics['loss'] >= 0 and statistics['seconds'] >= statistics['sgd_seconds']
+               for statistics in reported)
+    assert {'train_model.sgd', 'train_model.write', 'generate_recommendations.score'} <= set(instrumentation.stages)
+    assert instrumentation.stages['train_model.sgd']['count'] == 4  # Timed once per epoch
+
+    metrics = instrumentation.to_prometheus()
+    assert 'recommender_training_epochs{u="TU"} 4' in metrics
+    assert 'recommender_stage_calls_total{u="TU",stage="train_model.sgd"} 4' in metrics
+
+
+def test_profiled_stage_report(university):
+    recommendation_system = university.recommendation_system
+    instrumentation = recommendation_system.instrumentation = Instrumentation(profile_stage='train_model.sgd')
+    assert instrumentation.profile_statistics() == ''
+
+    recommendation_system.train_model(epochs=2)
+    assert 'function calls' in instrumentation.profile_statistics()
+
+
+def test_statistics_are_written_as_json(university, tmp_path):
+    recommendation_system = university.recommendation_system
+    recommendation_system.instrumentation = Instrumentation()
+    recommendation_system.reload_ratings(force=True)
+
+    path = tmp_path / 'statistics.json'
+    recommendation_system.instrumentation.write_json(path)
+    statistics = json.loads(path.read_text())
+    assert statistics['stages']['reload_ratings.fingerprint']['count'] == 1
+    assert list(tmp_path.glob('statistics.json.*')) == []
@@ -0,0 +1,74 @@
+import pickle
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from losses import Loss, MSE, HUBER, WEIGHTED_MSE, get_loss, register_loss, LOSSES
+from recommender import RecommendationSystem, _sgd_pass, factorize
+
+
+@pytest.mark.parametrize('loss', [MSE, HUBER, WEIGHTED_MSE], ids=lambda loss: loss.name)
+def test_gradient_is_the_derivative_of_the_value(loss):
+    residuals = np.linspace(-4, 4, 17) + 0.05
+    weights = loss.weights(np.arange(1.0, 18.0))
+    step = 1e-6
+    numerical = (loss.value(residuals + step, weights) - loss.value(residuals - step, weights)) / (2 * step)
+    np.testing.assert_allclose(loss.gradient(residuals, weights), numerical, rtol=1e-5)
+
+
+def test_built_in_losses():
+    residuals, weights = np.array([-3.0, 0.5, 2.0]), np.ones(3)
+    np.testing.assert_allclose(MSE.value(residuals, weights), [9, 0.25, 4])
+    np.testing.assert_allclose(HUBER.value(residuals, weights), [5, 0.25, 3])
+    np.testing.assert_allclose(WEIGHTED_MSE.weights(np.array([1.0, 10.0])), [2 / 11, 20 / 11])
+    assert get_loss('huber') is HUBER and get_loss(HUBER) is HUBER
+    with pytest.raises(AssertionError):
+        get_loss('unknown')
+
+
+def test_inline_gradients_match_custom_losses():
+    custom_huber = Loss('custom_huber', value=HUBER.value, gradient=HUBER.gradient)
+    examples = [(0, 0, 9.0, 1.0), (1, 0, 1.0, 1.0), (0, 1, 5.0, 1.0), (1, 1, 7.0, 1.0)]
+    factors = []
+    for loss in (HUBER, custom_huber):
+        Q, P = np.full((2, 2), 0.5), np.full((2, 2), 0.3)
+        _sgd_pass(Q, P, examples, 0.05, 0.1, loss)
+        factors.append((Q, P))
+    np.testing.assert_allclose(factors[0][0], factors[1][0])
+    np.testing.assert_allclose(factors[0][1], factors[1][1])
+
+
+def test_registered_losses_are_used_by_name(monkeypatch):
+    monkeypatch.setitem(LOSSES, 'absolute', None)
+    absolute = register_loss(Loss('absolute', value=lambda residuals, weights: weights * np.abs(residuals),
+                                  gradient=lambda residuals, weights: weights * np.sign(residuals)))
+    assert get_loss('absolute') is absolute
+
+    students, courses, ratings = np.array([0, 0, 1]), np.array([0, 1, 1]), np.array([8.0, 2.0, 5.0])
+    results = {name: factorize(students, courses, ratings, number_students=2, number_courses=2, number_factors=2,
+                               epochs=5, loss=name, random_state=0)
+               for name in ('mse', 'absolute')}
+    assert not np.allclose(results['mse'][0], results['absolute'][0])
+
+
+def test_recommendation_systems_store_the_loss_by_name(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.loss_function = 'weighted_mse'
+    session.commit()
+    errors = recommendation_system.train_model(epochs=3)
+    assert len(errors) == 3 and errors[-1] < errors[0]
+
+    session.expire_all()
+    assert session.query(RecommendationSystem.loss_function).scalar() == 'weighted_mse'
+
+
+def test_pickled_loss_functions_are_read_as_the_squared_error(university, session):
+    session.execute(text('UPDATE recommendation_system SET loss_function = :loss'),
+                    {'loss': pickle.dumps(np.square)})  # As stored by the PickleType column
+    session.commit()
+    session.expunge_all()
+
+    recommendation_system = session.query(RecommendationSystem).one()
+    assert recommendation_system.loss_function == 'mse'
+    assert len(recommendation_system.train_model(epochs=2)) == 2
@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import pytest
+
+from database import create_session_factory
+from recommender import Recommendation, ArchivedRecommendation, Ratings
+from university import University
+
+
+@pytest.fixture
+def recommendations(university, session):
+    university.recommendation_system.train_model(epochs=3)
+    return university.generate_recommendations(session)
+
+
+def test_recommendations_are_generated_once_a_day(university, session, recommendations):
+    number_recommendations = session.query(Recommendation).count()
+    university.generate_recommendations(session)
+    assert session.query(Recommendation).count() == number_recommendations
+
+
+@pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')
+def test_compact_archives_the_unrated_recommendations(university, session, recommendations):
+    rated = next(iter(recommendations.values()))[0]
+    rated.add_rating(Ratings.HELPFUL, session)
+    unrated_ids = {recommendation.id for student_recommendations in recommendations.values()
+                   for recommendation in student_recommendations} - {rated.id}
+    student = rated.student
+
+    removed = Recommendation.compact(session, date.today() + timedelta(days=1), commit=False)
+
+    assert removed == len(unrated_ids)
+    assert [recommendation.id for recommendation in session.query(Recommendation)] == [rated.id]
+    assert {archived.original_id for archived in session.query(ArchivedRecommendation)} == unrated_ids
+    assert list(student.recommendations) == [rated]
+    assert not any(isinstance(instance, Recommendation) and instance.id in unrated_ids
+                   for instance in session.identity_map.values())
+    session.commit()
+
+
+def test_compact_can_run_again_once_identifiers_are_reused(university, session, recommendations):
+    tomorrow = date.today() + timedelta(days=1)
+    first = Recommendation.compact(session, tomorrow)
+    session.query(Recommendation).delete()
+    session.commit()
+    university.generate_recommendations(session)
+
+    second = Recommendation.compact(session, tomorrow)
+
+    assert session.query(ArchivedRecommendation).count() == first + second
+    assert session.query(Recommendation).count() == 0
+
+
+def test_compact_keeps_recent_recommendations(university, session, recommendations):
+    assert Recommendation.compact(session, date.today()) == 0
+    assert session.query(ArchivedRecommendation).count() == 0
+
+
+def test_recommendations_stored_concurrently_are_reused(university, session, monkeypatch):
+    university.recommendation_system.train_model(epochs=3)
+    session.commit()
+    generated_on = Recommendation.generated_on.__func__
+    concurrent = {}
+    looked_up = []
+
+    def generated_on_then_store_concurrently(cls, date_generated, students, session, **kwargs):
+        recommendations = generated_on(cls, date_generated, students, session, **kwargs)
+        looked_up.append(session)
+        if len(looked_up) == 1:
+            # Another session generates the top recommendation of each student after this one has looked them up
+            other_session = create_session_factory(session.get_bind())()
+            other_university = other_session.query(University).get(university.id)
+            concurrent.update((recommendation.id, (recommendation.student_id, recommendation.course_id))
+                              for student_recommendations in other_university.generate_recommendations(
+                                  other_session, number_recommendations=1).values()
+                              for recommendation in student_recommendations)
+            other_session.close()
+        return recommendations
+
+    monkeypatch.setattr(Recommendation, 'generated_on', classmethod(generated_on_then_store_concurrently))
+    recommendations = university.generate_recommendations(session)
+    session.commit()
+
+    stored = {recommendation.id: (recommendation.student_id, recommendation.course_id)
+              for student_recommendations in recommendations.values() for recommendation in student_recommendations}
+    assert set(concurrent.items()) <= set(stored.items())
+    assert len(stored) > len(concurrent)
+    assert session.query(Recommendation).count() == len(stored)
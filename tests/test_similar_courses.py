@@ -0,0 +1,50 @@
+import numpy as np
+
+from recommender import CourseNeighbours
+
+
+def test_neighbours_are_the_most_similar_factors_in_every_block():
+    random_state = np.random.default_rng(0)
+    Q = random_state.normal(size=(50, 4))
+    Q[7] = 0  # A course without factors is similar to none
+    course_numbers = [f'C{i}' for i in range(50)]
+
+    table = CourseNeighbours.from_factors(Q, course_numbers, number_neighbours=5, block_size=8)
+
+    normalized = Q / np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-12)
+    similarities = normalized @ normalized.T
+    np.fill_diagonal(similarities, -np.inf)
+    for position, course_number in enumerate(course_numbers):
+        similar = table.similar(course_number, 5)
+        expected = np.sort(similarities[position])[::-1][:5]
+        assert [course for course, _ in similar if course == course_number] == []
+        np.testing.assert_allclose([similarity for _, similarity in similar], expected, atol=1e-5)
+
+
+def test_lookup_limits(tmp_path):
+    table = CourseNeighbours.from_factors(np.eye(3), ['A', 'B', 'C'], number_neighbours=10)
+    assert table.neighbours.shape == (3, 2)
+    assert [course for course, _ in table.similar('A', 5)] in (['B', 'C'], ['C', 'B'])
+    assert len(table.similar('A', 1)) == 1
+    assert table.similar('D', 5) == []
+
+    table.save(tmp_path / 'neighbours.npz')
+    loaded = CourseNeighbours.load(str(tmp_path / 'neighbours.npz'))
+    assert loaded.similar('B', 5) == table.similar('B', 5)
+
+
+def test_similar_courses_of_the_trained_model(university, session):
+    recommendation_system = university.recommendation_system
+    assert recommendation_system.similar_courses('C0') == []
+
+    recommendation_system.train_model(epochs=3, number_neighbours=2)
+    similar = recommendation_system.similar_courses('C0', k=5)
+    assert len(similar) == 2
+    assert {course for course, _ in similar} <= {'C1', 'C2', 'C3', 'C4'}
+    assert similar[0][1] >= similar[1][1]
+
+    # Courses added since training have no neighbours yet
+    session.add(university.add_course(name='Course 5', course_number='C5', semester_of_availability=1))
+    session.commit()
+    recommendation_system.reload_ratings()
+    assert recommendation_system.similar_courses('C5') == []
@@ -0,0 +1,61 @@
+import os
+
+
+def test_publish_makes_the_new_snapshot_current_and_inherits_the_other_files(university):
+    recommendation_system = university.recommendation_system
+    before = recommendation_system.open_snapshot()
+
+    version = recommendation_system.publish_snapshot({'extra.txt': lambda path: open(path, 'w').write('x')},
+                                                     note='test')
+
+    current = recommendation_system.open_snapshot()
+    assert current.version == version == recommendation_system.snapshot_version
+    assert current.metadata['note'] == 'test'
+    assert os.path.exists(current.path('extra.txt'))
+    assert os.path.exists(current.path(recommendation_system.known_ratings_matrix_path))
+    # Readers of the previous snapshot keep reading it
+    assert before.known_ratings_matrix.equals(current.known_ratings_matrix)
+    assert not os.path.exists(before.path('extra.txt'))
+
+
+def test_rollback_restores_the_previous_snapshot_and_model_state(university):
+    recommendation_system = university.recommendation_system
+    untrained = recommendation_system.open_snapshot().version
+    recommendation_system.train_model(epochs=2)
+    assert recommendation_system.trained and recommendation_system.model_version == 1
+
+    assert recommendation_system.rollback() == untrained
+    assert recommendation_system.open_snapshot().version == untrained
+    assert not recommendation_system.trained
+    assert recommendation_system.open_snapshot().metadata['model_version'] == 0
+    assert recommendation_system.parameters is None
+
+
+def test_rolled_back_model_versions_are_not_reused(university, session):
+    recommendation_system = university.recommendation_system
+    recommendation_system.train_model(epochs=2)
+    first = recommendation_system.open_snapshot().version
+    recommendation_system.train_model(epochs=3)
+    recommendation_system.rollback(first)
+    recommendation_system.reload_ratings(force=True)
+
+    # The recommendations record the version of the model which generated them
+    assert recommendation_system.open_snapshot().metadata['model_version'] == 1
+    student = university.students[0]
+    assert {recommendation.model_version for recommendation in student.generate_recommendations(session)} == {1}
+
+    recommendation_system.train_model(epochs=4)
+    assert recommendation_system.model_version == 3
+    assert recommendation_system.open_snapshot().metadata['model_version'] == 3
+
+
+def test_prune_keeps_the_most_recent_and_the_current_snapshots(university):
+    recommendation_system = university.recommendation_system
+    for _ in range(recommendation_system.retained_snapshots + 3):
+        recommendation_system.reload_ratings(force=True)
+    assert len(recommendation_system.snapshot_versions()) == recommendation_system.retained_snapshots
+
+    oldest = recommendation_system.snapshot_versions()[0]
+    recommendation_system.rollback(oldest)
+    recommendation_system.prune_snapshots(retained_snapshots=1)
+    assert oldest in recommendation_system.snapshot_versions()
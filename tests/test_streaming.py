@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from recommender import write_rating_shards, factorize_streaming, factorize, index_ratings, streaming_block_size
+from evaluation import rmse
+
+
+def test_shards_hold_every_rating(university, tmp_path):
+    snapshot = university.recommendation_system.open_snapshot()
+    student_numbers, course_numbers = snapshot.student_numbers, snapshot.course_numbers
+    directory = str(tmp_path / 'shards')
+
+    paths = write_rating_shards(snapshot.known_ratings_matrix_path, directory, student_numbers, course_numbers,
+                                shard_size=4)
+    shards = [np.load(path) for path in paths]
+    assert all(len(shard) <= 4 for shard in shards)
+    students, courses, ratings = index_ratings(snapshot.known_ratings_matrix, student_numbers, course_numbers)
+    stored = np.concatenate(shards)
+    np.testing.assert_array_equal(stored['student'], students)
+    np.testing.assert_array_equal(stored['course'], courses)
+    np.testing.assert_array_equal(stored['rating'], ratings)
+
+    # Existing shards are reused
+    assert write_rating_shards(snapshot.known_ratings_matrix_path, directory, student_numbers, course_numbers,
+                               shard_size=100) == paths
+
+
+def test_streaming_fits_the_ratings_like_in_memory_training(tmp_path):
+    random_state = np.random.default_rng(0)
+    students, courses = np.nonzero(random_state.random((40, 12)) < 0.5)
+    ratings = np.clip(np.round(random_state.normal(6, 2, len(students))), 1, 10)
+    shard = np.empty(len(students), dtype=[('student', '<i4'), ('course', '<i4'), ('rating', '<f4')])
+    shard['student'], shard['course'], shard['rating'] = students, courses, ratings
+    paths = [str(tmp_path / 'shard_00000.npy'), str(tmp_path / 'shard_00001.npy')]
+    np.save(paths[0], shard[:len(shard) // 2])
+    np.save(paths[1], shard[len(shard) // 2:])
+
+    # A budget of 20 ratings per block
+    memory_budget = 20 * (12 + 8 + 200 + 2 * 8 * 3)
+    assert streaming_block_size(memory_budget, 3) == 20
+    Q, P, errors = factorize_streaming(paths, number_students=40, number_courses=12,
+                                       work_directory=str(tmp_path / 'work'), number_factors=3, epochs=20,
+                                       memory_budget=memory_budget, random_state=0)
+    assert isinstance(Q, np.memmap) and os.path.exists(tmp_path / 'work' / 'Q.npy')
+    assert errors[-1] < errors[0]
+
+    in_memory_Q, in_memory_P, _ = factorize(students, courses, ratings, number_students=40, number_courses=12,
+                                            number_factors=3, epochs=40, random_state=0)
+    assert rmse(np.asarray(Q), np.asarray(P), students, courses, ratings) < \
+        1.5 * rmse(in_memory_Q, in_memory_P, students, courses, ratings)
+
+
+def test_streaming_training_publishes_the_model(university):
+    recommendation_system = university.recommendation_system
+    errors = recommendation_system.train_model(epochs=3, number_factors=2, streaming=True, memory_budget=4096)
+
+    assert len(errors) == 3
+    Q, P = recommendation_system.parameters
+    snapshot = recommendation_system.open_snapshot()
+    assert list(Q.index) == list(snapshot.course_numbers) and list(P.index) == list(snapshot.student_numbers)
+    assert Q.shape[1] == P.shape[1] == 2
+    assert not os.path.exists(recommendation_system._streaming_directory)
@@ -1,5 +1,5 @@
 from sqlalchemy import UniqueConstraint, Index
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Boolean, select
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.associationproxy import association_proxy
 
@@ -9,8 +9,11 @@ from datetime import date
 from user import User
 from student import Student, StudentCourse
 from tutor import TutorUniversity
-from recommender import RecommendationSystem
-from utils import Base, MSE
+from person import Person, Name
+from recommender import RecommendationSystem, Recommendation, RecommendationRating, ArchivedRecommendation
+from recommender import RecommendationFeedback
+from union import StudentUnion
+from utils import Base, UnitOfWork, commit_or_defer, remove_or_defer, expunge_deleted
 
 
 class UniversityType(enum.Enum):
@@ -68,6 +71,20 @@ class University(User):
         if initialize_recommendation_system:
             self.initialize_recommendation_system()
 
+    def batch(self, session):
+        """Returns a context manager batching the changes made through the ''session''. Within it, the commits of
+        e.g. :class:'Student'.''rate_course'', ''generate_recommendations'', :class:'Recommendation'.''add_rating'',
+        ''delete_student'', ''delete_course'' and ''terminate_employment'' are deferred, as well as the ratings reloads
+        of ''rate_course''. When the context exits, all the changes are committed in a single transaction, and the
+        ratings of each affected :class:'RecommendationSystem' are reloaded once.
+
+        Usage: ''with university.batch(session): ...''
+
+        :param session: SQLAlchemy :class:'Session' object allowing to issue queries against the database.
+        :return: :class:'UnitOfWork' object.
+        """
+        return UnitOfWork(session)
+
     def find_student(self, student_number, session):
         """Finds and returns the instance of :class:'Student' corresponding to the ''student_number''
 
@@ -116,30 +133,150 @@ class University(User):
                                       password=password, separator=separator)
         return student
 
-    def delete_student(self, student, session, commit=True):
+    def delete_student(self, student, session, commit=True, update_recommendation_system=True):
         """Deletes the :class:'Student' object from this university, hence removing it from the system entirely. All
-        associated :class:'StudentCourse' objects are also deleted.
+        associated :class:'StudentCourse' objects are also deleted (see ''delete_students'').
 
         :param student: :class:'Student' object to remove.
         :param session: SQLAlchemy session allowing to issue queries against the database.
         :param commit: If True writes the changes to the database.
+        :param update_recommendation_system: Whether to remove the student from the files of the recommendation system
+        (see ''delete_students'').
         """
-        assert student.university is self, 'Cannot delete a student who does not study at this university'
-        session.delete(student)
-        if commit:
-            session.commit()
-
-    def delete_course(self, course, session, commit=True):
-        """Deletes the :class:'Course' object from this university, hence removing it from the system entirely.
+        self.delete_students([student], session, commit=commit,
+                             update_recommendation_system=update_recommendation_system)
+
+    def delete_students(self, students, session, commit=True, update_recommendation_system=True):
+        """Deletes many :class:'Student' objects from this university at once, hence removing them from the system
+        entirely, along with their names, enrollments, union memberships, recommendations and recommendation ratings.
+        The rows are removed with a few set-based DELETE statements, instead of loading every dependent object into
+        the session and deleting it one at a time. The students are also removed from the ratings, the course ranking
+        and the model parameters of the recommendation system (without retraining) once the changes are committed -
+        if ''commit'' is False, when the session is next committed (and not at all if it is rolled back instead).
+
+        :param students: List of :class:'Student' objects to remove.
+        :param session: SQLAlchemy session allowing to issue queries against the database.
+        :param commit: If True writes the changes to the database.
+        :param update_recommendation_system: Whether to remove the students from the files of the recommendation
+        system, which rewrites them. For efficiency reasons, it is best to delete many students in a single call, or
+        within :class:'University'.''batch'', which removes all the deleted students and courses at once at its end; if
+        False, the deleted students remain in the model until it is next trained (default: True).
+        """
+        students = list(students)
+        assert all(student.university is self for student in students), \
+            'Cannot delete a student who does not study at this university'
+        session.flush()
+        student_ids = [student.id for student in students]
+        student_numbers = [student.student_number for student in students]
+
+        enrollments = []
+        for chunk in _chunks(student_ids):
+            enrollments += session.query(Student.student_number, Course.course_number)\
+                .join(StudentCourse, StudentCourse.student_id == Student.id)\
+                .join(Course, StudentCourse.course_id == Course.id)\
+                .filter(Student.id.in_(chunk)).all()
+
+            recommendation_ids = select([Recommendation.id]).where(Recommendation.student_id.in_(chunk))
+            RecommendationFeedback.withdraw(session, recommendation_ids)
+            session.query(RecommendationRating).filter(RecommendationRating.recommendation_id.in_(recommendation_ids))\
+                .delete(synchronize_session=False)
+            for column in (Recommendation.student_id, ArchivedRecommendation.student_id, StudentCourse.student_id,
+                           StudentUnion.student_id, Name.person_id):
+                session.query(column.class_).filter(column.in_(chunk)).delete(synchronize_session=False)
+            # The rows of a student are spread over the tables of the class hierarchy, the subclass table first
+            for table in (Student.__table__, Person.__table__, User.__table__):
+                session.execute(table.delete().where(table.c.id.in_(chunk)))
+
+        self._finish_bulk_deletion(session, commit, update_recommendation_system,
+                                   (Student, Name, StudentCourse, StudentUnion, Recommendation, RecommendationRating,
+                                    ArchivedRecommendation), student_numbers=student_numbers, enrollments=enrollments)
+
+    def delete_course(self, course, session, commit=True, update_recommendation_system=True):
+        """Deletes the :class:'Course' object from this university, hence removing it from the system entirely (see
+        ''delete_courses'').
 
         :param course: :class:'Student' object to remove.
         :param session: SQLAlchemy session allowing to issue queries against the database.
         :param commit: If True writes the changes to the database.
+        :param update_recommendation_system: Whether to remove the course from the files of the recommendation system
+        (see ''delete_courses'').
+        """
+        self.delete_courses([course], session, commit=commit,
+                            update_recommendation_system=update_recommendation_system)
+
+    def delete_courses(self, courses, session, commit=True, update_recommendation_system=True):
+        """Deletes many :class:'Course' objects from this university at once, hence removing them from the system
+        entirely, along with the enrollments in them, the recommendations of them and the ratings of these
+        recommendations, using set-based DELETE statements. The courses are also removed from the ratings, the course
+        ranking and the model parameters of the recommendation system (without retraining) once the changes are
+        committed (see ''delete_students'').
+
+        :param courses: List of :class:'Course' objects to remove.
+        :param session: SQLAlchemy session allowing to issue queries against the database.
+        :param commit: If True writes the changes to the database.
+        :param update_recommendation_system: Whether to remove the courses from the files of the recommendation
+        system, which rewrites them (see ''delete_students''; default: True).
+        """
+        courses = list(courses)
+        assert all(course.university is self for course in courses), \
+            'Cannot delete a course which is not offered at this university'
+        session.flush()
+        course_ids = [course.id for course in courses]
+        course_numbers = [course.course_number for course in courses]
+
+        for chunk in _chunks(course_ids):
+            recommendation_ids = select([Recommendation.id]).where(Recommendation.course_id.in_(chunk))
+            RecommendationFeedback.withdraw(session, recommendation_ids)
+            session.query(RecommendationRating).filter(RecommendationRating.recommendation_id.in_(recommendation_ids))\
+                .delete(synchronize_session=False)
+            for column in (Recommendation.course_id, ArchivedRecommendation.course_id, StudentCourse.course_id,
+                           RecommendationFeedback.course_id, Course.id):
+                session.query(column.class_).filter(column.in_(chunk)).delete(synchronize_session=False)
+
+        self._finish_bulk_deletion(session, commit, update_recommendation_system,
+                                   (Course, StudentCourse, Recommendation, RecommendationRating, ArchivedRecommendation,
+                                    RecommendationFeedback), course_numbers=course_numbers)
+
+    def _finish_bulk_deletion(self, session, commit, update_recommendation_system, classes, **removed):
+        """Brings the session and the recommendation system in line with the rows deleted by ''delete_students'' or
+        ''delete_courses''.
+        """
+        # The objects in the session do not know about the rows deleted in bulk
+        expunge_deleted(session, *classes)
+
+        if commit:
+            commit_or_defer(session)
+        recommendation_system = self.recommendation_system
+        if update_recommendation_system and recommendation_system is not None:
+            remove_or_defer(recommendation_system, session, committed=commit, **removed)
+
+    def generate_recommendations(self, session, number_recommendations=3, students=None, commit=True,
+                                 electives_only=True, eligible_only=False):
+        """Generates recommendations for all (or the given) students of this university in a single batch.
+
+        :param session: SQLAlchemy :class:'Session' object allowing to issue queries against the database.
+        :param number_recommendations: Number of recommendations to generate for each student.
+        :param students: List of :class:'Student' objects to generate the recommendations for. If ''None'', the
+        recommendations are generated for all students of this university.
+        :param commit: If True writes the generated objects to the database.
+        :param electives_only: Whether to only recommend elective courses (default: True).
+        :param eligible_only: Whether to only recommend courses available in a semester the student has not completed
+        yet, checked for each cohort of students with the same number of completed terms (default: False).
+        :return: A dictionary mapping each :class:'Student' object to a list of :class:'Recommendation' objects.
         """
-        assert course.university is self, 'Cannot delete a course which is not offered at this university'
-        session.delete(course)
+        if students is None:
+            students = self.students
+        assert all(student.university is self for student in students), \
+            'Cannot generate recommendations for a student who does not study at this university'
+
+        recommendations = self.recommendation_system.generate_batch_recommendations(
+            students, session, number_recommendations=number_recommendations, electives_only=electives_only,
+            eligible_only=eligible_only)
+        for student_recommendations in recommendations:
+            session.add_all(student_recommendations)
         if commit:
-            session.commit()
+            commit_or_defer(session)
+        return dict(zip(students, recommendations))
 
     def add_tutor(self, *, tutor, remuneration, end_date, start_date=date.today()):
         """Hires a tutor at the calling :class:'University' object.
@@ -166,7 +303,7 @@ class University(User):
         assert employment.university is self, 'Cannot delete a tutor which does not teach at this university'
         session.delete(employment)
         if commit:
-            session.commit()
+            commit_or_defer(session)
 
     def add_course(self, *, name, course_number, semester_of_availability,
                    abbreviation=None, description=None, is_elective=True):
@@ -187,18 +324,20 @@ class University(User):
                       semester_of_availability=semester_of_availability,
                       description=description, is_elective=is_elective)
 
-    def initialize_recommendation_system(self, loss_function=MSE,
-                                         student_course_matrix_path=None, model_parameters_path=None):
+    def initialize_recommendation_system(self, loss_function='mse', student_course_matrix_path=None,
+                                         model_parameters_path=None, model_directory=None):
         """Initializes the :class:'RecommendationSystem'.
 
-        :param loss_function: A mathematical function for calculating the cost / loss on training examples
-        (Default = MSE).
-        :param student_course_matrix_path: A path to a .csv file containing the ratings of courses (:class:'Course')
+        :param loss_function: The name of the loss function minimized in training, registered in :mod:'losses'
+        (Default = ''mse'').
+        :param student_course_matrix_path: A name of the .csv file containing the ratings of courses (:class:'Course')
         added by students (:class:'Student'). If ''None'' is passed, a default value will be set.
-        :param model_parameters_path: A path to a .bin file containing the parameters of the model. If ''None'' is
+        :param model_parameters_path: A name of the .bin file containing the parameters of the model. If ''None'' is
         passed, a default value will be set.
+        :param model_directory: A path to the directory containing the snapshots of the recommendation system. If
+        ''None'' is passed, a default value will be set.
         """
-        RecommendationSystem(university=self, loss_function=loss_function,
+        RecommendationSystem(university=self, loss_function=loss_function, model_directory=model_directory,
                              student_course_matrix_path=student_course_matrix_path,
                              model_parameters_path=model_parameters_path)
 
@@ -266,3 +405,8 @@ class Course(Base):
     def __str__(self):
         return f'{self.name} ({self.abbreviation})'
 
+
+def _chunks(values, size=500):
+    """Splits the list ''values'' into lists of at most ''size'' elements, to bound the number of parameters of a query.
+    """
+    return [values[start:start + size] for start in range(0, len(values), size)]
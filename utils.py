@@ -3,5 +3,168 @@ from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 
-def MSE(data):
-    pass
+class UnitOfWork:
+    """A context manager batching the changes made through a session. Within it, the methods which would commit the
+    session, or reload the ratings of a :class:'RecommendationSystem', only queue these operations. They are performed
+    once, when the outermost context exits: all the changes are committed in a single transaction, after which the
+    students and courses deleted within the context are removed from each affected recommendation system at once, and
+    its ratings are reloaded once. If an exception is raised, the session is rolled back and nothing is reloaded.
+
+    :param session: SQLAlchemy session object allowing to issue queries against the database.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.recommendation_systems = []  # Recommendation systems whose ratings to reload, in the order requested
+        self.removals = {}  # Students, courses and enrollments to remove from each recommendation system
+        self.nested = False
+
+    @staticmethod
+    def active(session):
+        """Returns the :class:'UnitOfWork' active for the ''session'', or ''None''."""
+        return session.info.get('unit_of_work')
+
+    def __enter__(self):
+        # Nested contexts join the outermost one
+        self.nested = UnitOfWork.active(self.session) is not None
+        if not self.nested:
+            self.session.info['unit_of_work'] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.nested:
+            return False
+        del self.session.info['unit_of_work']
+        if exc_type is not None:
+            self.session.rollback()
+            return False
+
+        self.session.commit()
+        for recommendation_system, removed in self.removals.items():
+            recommendation_system.remove(**removed)
+        for recommendation_system in self.recommendation_systems:
+            recommendation_system.reload_ratings()
+        return False
+
+
+def commit_or_defer(session):
+    """Commits the ''session'', or defers the commit until the active :class:'UnitOfWork' exits.
+
+    :param session: SQLAlchemy session object allowing to issue queries against the database.
+    """
+    if UnitOfWork.active(session) is None:
+        session.commit()
+
+
+def reload_or_defer(recommendation_system, session):
+    """Reloads the ratings of the ''recommendation_system'', or defers the reload until the active :class:'UnitOfWork'
+    exits (reloading the ratings of each recommendation system only once).
+
+    :param recommendation_system: :class:'RecommendationSystem' object whose ratings to reload.
+    :param session: SQLAlchemy session object allowing to issue queries against the database.
+    """
+    unit_of_work = UnitOfWork.active(session)
+    if unit_of_work is None:
+        recommendation_system.reload_ratings()
+    elif recommendation_system not in unit_of_work.recommendation_systems:
+        unit_of_work.recommendation_systems.append(recommendation_system)
+
+
+def remove_or_defer(recommendation_system, session, *, committed=True, student_numbers=(), course_numbers=(),
+                    enrollments=()):
+    """Removes students and courses from the ''recommendation_system'' (see :class:'RecommendationSystem'.''remove''),
+    or defers the removal until the active :class:'UnitOfWork' has committed its changes (removing all the students and
+    courses deleted within it at once). Outside of a unit of work, the removal of deletions which have not been
+    ''committed'' yet is deferred until the session is committed, and discarded if the session is rolled back instead.
+
+    :param recommendation_system: :class:'RecommendationSystem' object to remove the students and courses from.
+    :param session: SQLAlchemy session object allowing to issue queries against the database.
+    :param committed: Whether the deletions of the students and courses have been committed.
+    :param student_numbers: Student numbers of the removed students.
+    :param course_numbers: Course numbers of the removed courses.
+    :param enrollments: Pairs (student number, course number) of the removed enrollments of the remaining courses.
+    """
+    unit_of_work = UnitOfWork.active(session)
+    if unit_of_work is not None:
+        removals = unit_of_work.removals
+    elif not committed:
+        removals = _removals_after_commit(session)
+    else:
+        recommendation_system.remove(student_numbers=student_numbers, course_numbers=course_numbers,
+                                     enrollments=enrollments)
+        return
+    removed = removals.setdefault(recommendation_system, dict(student_numbers=[], course_numbers=[], enrollments=[]))
+    removed['student_numbers'] += student_numbers
+    removed['course_numbers'] += course_numbers
+    removed['enrollments'] += enrollments
+
+
+def _removals_after_commit(session):
+    """Returns the removals from recommendation systems to perform once the ''session'' is next committed, listening to
+    the commits and rollbacks of the session the first time.
+    """
+    from sqlalchemy import event
+
+    if 'removals_after_commit' not in session.info:
+        session.info['removals_after_commit'] = {}
+        if not session.info.get('removal_listeners'):
+            session.info['removal_listeners'] = True
+            event.listen(session, 'after_commit', _remove_after_commit)
+            event.listen(session, 'after_soft_rollback', _discard_removals)
+    return session.info['removals_after_commit']
+
+
+def _remove_after_commit(session):
+    # Releasing a savepoint does not commit the deletions
+    if session.transaction.nested:
+        return
+    for recommendation_system, removed in session.info.pop('removals_after_commit', {}).items():
+        recommendation_system.remove(**removed)
+
+
+def _discard_removals(session, previous_transaction):
+    # Neither does rolling back a savepoint (or a flush) roll them back
+    if previous_transaction.parent is None:
+        session.info.pop('removals_after_commit', None)
+
+
+def expunge_deleted(session, *classes):
+    """Removes from the ''session'' the loaded objects of the ''classes'' whose rows have been deleted by bulk
+    statements (e.g. ''Query.delete(synchronize_session=False)''), so that new rows reusing their primary keys are not
+    mistaken for them, and expires the loaded relationships of the other objects which still refer to them. Which rows
+    remain is checked with one query per class, limited to the primary keys of the loaded objects.
+
+    :param session: SQLAlchemy session object allowing to issue queries against the database.
+    :param classes: The mapped classes whose rows may have been deleted.
+    :return: List of the removed objects.
+    """
+    from sqlalchemy import inspect
+
+    session.flush()
+    removed = []
+    for cls in classes:
+        primary_key = inspect(cls).primary_key
+        # The identities of the loaded objects are known without loading their (possibly deleted) rows
+        loaded = {inspect(instance).identity: instance for instance in list(session.identity_map.values())
+                  if isinstance(instance, cls)}
+        first_values = list({identity[0] for identity in loaded})
+        remaining = set()
+        for start in range(0, len(first_values), 500):
+            remaining.update(tuple(row) for row in session.query(*primary_key)
+                             .filter(primary_key[0].in_(first_values[start:start + 500])))
+        removed += [instance for identity, instance in loaded.items() if identity not in remaining]
+
+    for instance in removed:
+        # Expunging an object cascades to its dependents (e.g. the enrollments of a student) which may be among them
+        if instance in session:
+            session.expunge(instance)
+    removed_ids = {id(instance) for instance in removed}
+    if removed_ids:
+        for instance in list(session.identity_map.values()):
+            state = inspect(instance)
+            for relationship in state.mapper.relationships:
+                value = state.dict.get(relationship.key)
+                values = value if relationship.uselist and value is not None else [value]
+                if any(id(related) in removed_ids for related in values):
+                    session.expire(instance, [relationship.key])
+    return removed